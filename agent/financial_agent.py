@@ -1,8 +1,12 @@
 import os
+import re
 import sys
 import json
-import sqlite3
+import orjson
+import asyncio
+from itertools import islice
 from pathlib import Path
+from types import MappingProxyType
 from datetime import datetime
 from typing import Dict, List, Any, TypedDict, Optional
 
@@ -11,7 +15,6 @@ project_root = str(Path(__file__).resolve().parent)
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END, START
@@ -20,50 +23,77 @@ from dotenv import load_dotenv
 # Import the tools
 from tools import get_all_tools
 
+# Shared SQLite helpers (connection cache, WAL tuning, LRU-cached reads)
+from recommendations_db import (
+    save_recommendation_to_db,
+    save_recommendations_bulk,
+    get_user_recommendations,
+)
+
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Compiled once at import; the greedy regex is only a fallback — raw_decode
+# from the first '{' avoids backtracking over large LLM outputs
+_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+_JSON_DECODER = json.JSONDecoder()
+
+# Allocation percentages per risk profile, frozen so the per-call dict
+# literal (and accidental mutation) is avoided
+_ALLOCATIONS = MappingProxyType({
+    "Low": {"stocks": "10%", "mutual_funds": "40%", "fixed_deposits": "50%"},
+    "Medium": {"stocks": "40%", "mutual_funds": "40%", "fixed_deposits": "20%"},
+    "High": {"stocks": "70%", "mutual_funds": "25%", "fixed_deposits": "5%"}
+})
+
 # --- 1. Define the State for our Graph ---
 class GraphState(TypedDict):
     user_id: int
     user_profile: Optional[Dict[str, Any]]
     market_data: Optional[Dict[str, Any]]
     recommendation: Optional[Dict[str, Any]]
+    # The parallel fetch branches write to distinct error keys: both nodes
+    # run in the same superstep, and concurrent writes to one reducer-less
+    # key would raise InvalidUpdateError. The join node merges them into
+    # the public "error" field.
+    profile_error: Optional[str]
+    market_error: Optional[str]
     error: Optional[str]
 
-# Initialize the LLM and tools
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0)
+# Initialize the LLM (shared, persistent-connection client) and tools
+from llm_client import llm
 tools = get_all_tools()
 user_profile_tool = tools[0]  # UserProfileTool
 market_data_tool = tools[1]   # MarketDataTool
 portfolio_tool = tools[2]     # PortfolioTool
 
 # --- 2. Define the Agent Nodes ---
-def fetch_user_profile(state: GraphState):
+async def fetch_user_profile(state: GraphState):
     """Node to fetch user profile."""
     print("---NODE: Fetching User Profile---")
     try:
-        data = user_profile_tool._run(state["user_id"])
+        data = await asyncio.to_thread(user_profile_tool._run, state["user_id"])
         if "error" in data:
             print(f"ERROR: {data['error']}")
-            return {"error": data['error']}
+            return {"profile_error": data['error']}
         return {"user_profile": data}
     except Exception as e:
         print(f"Error fetching user profile: {e}")
-        return {"error": str(e)}
+        return {"profile_error": str(e)}
 
-def fetch_market_data(state: GraphState):
+async def fetch_market_data(state: GraphState):
     """Node to fetch market data."""
     print("---NODE: Fetching Market Data---")
     try:
-        data = market_data_tool._run()
+        data = await asyncio.to_thread(market_data_tool._run)
         if "error" in data:
             print(f"ERROR: {data['error']}")
-            return {"error": data['error']}
+            return {"market_error": data['error']}
         return {"market_data": data}
     except Exception as e:
         print(f"Error fetching market data: {e}")
-        return {"error": str(e)}
+        return {"market_error": str(e)}
 
 # Define the output structure for the LLM
 class Recommendation(BaseModel):
@@ -86,185 +116,233 @@ class Recommendation(BaseModel):
     generated_at: str = Field(default_factory=lambda: datetime.now().isoformat())
     user_id: int = Field(..., description="The ID of the user this recommendation is for")
 
-def generate_recommendation(state: GraphState):
-    """Node to generate the investment recommendation based on the user's profile."""
-    print("---NODE: Generating Recommendation---")
-    profile = state['user_profile']
-    market = state['market_data']
-    
-    risk_appetite = profile.get("risk_appetite", "Medium")
-    
-    # Define the allocation based on risk profile
-    allocations = {
-        "Low": {"stocks": "10%", "mutual_funds": "40%", "fixed_deposits": "50%"},
-        "Medium": {"stocks": "40%", "mutual_funds": "40%", "fixed_deposits": "20%"},
-        "High": {"stocks": "70%", "mutual_funds": "25%", "fixed_deposits": "5%"}
-    }
-    
-    chosen_allocation = allocations.get(risk_appetite, allocations["Medium"])
-
-    # Create the prompt with explicit instructions for JSON output
-    prompt = ChatPromptTemplate.from_messages([
-
-    ("system", """You are a financial advisor providing investment recommendations.
-
-        You MUST respond with a valid JSON object that matches this schema:
-
-        {{
-            "allocation_summary": {{
-                "stocks": "string (percentage with % sign)",
-                "mutual_funds": "string (percentage with % sign)",
-                "fixed_deposits": "string (percentage with % sign)"
-            }},
-
-            "suggested_instruments": {{
-                "stocks": [
-                    {{
-                        "symbol": "SYM001",
-                        "name": "Company Name",
-                        "sector": "Sector Name",
-                        "growth_pct_yoy": 0.0
-                    }}
-                ],
-                "mutual_funds": [
-                    {{
-                        "code": "MF_XXX_XXX",
-                        "name": "Fund Name",
-                        "category": "Category",
-                        "return_pct_3y_cagr": 0.0
-                    }}
-                ],
-                "fixed_deposits": [
-                    {{
-                        "bank": "Bank Name",
-                        "tenure_months": 12,
-                        "rate_pct": 0.0
-                    }}
-                ]
+# Prompt with explicit instructions for JSON output, parsed once at import;
+# the chain is likewise built once instead of per invocation
+_PROMPT = ChatPromptTemplate.from_messages([
+
+("system", """You are a financial advisor providing investment recommendations.
+
+    You MUST respond with a valid JSON object that matches this schema:
+
+    {{
+        "allocation_summary": {{
+            "stocks": "string (percentage with % sign)",
+            "mutual_funds": "string (percentage with % sign)",
+            "fixed_deposits": "string (percentage with % sign)"
+        }},
+
+        "suggested_instruments": {{
+            "stocks": [
+                {{
+                    "symbol": "SYM001",
+                    "name": "Company Name",
+                    "sector": "Sector Name",
+                    "growth_pct_yoy": 0.0
+                }}
+            ],
+            "mutual_funds": [
+                {{
+                    "code": "MF_XXX_XXX",
+                    "name": "Fund Name",
+                    "category": "Category",
+                    "return_pct_3y_cagr": 0.0
+                }}
+            ],
+            "fixed_deposits": [
+                {{
+                    "bank": "Bank Name",
+                    "tenure_months": 12,
+                    "rate_pct": 0.0
+                }}
+            ]
+        }},
+
+        "investment_plan": {{
+            "monthly_investment": "₹X",
+            "emergency_fund": "₹X",
+
+            // emergency_fund = 5% of (monthly_income - monthly_expenses)
+            // monthly_investment = (monthly_income - monthly_expenses) - emergency_fund
+
+            "goal_breakdown": {{
+                "goal_1": {{"name": "Goal Name", "amount": "₹X", "strategy": "..."}},
+                "goal_2": {{"name": "Goal Name", "amount": "₹X", "strategy": "..."}},
+                ...(until all goals are covered)
+
+                // Divide investment goal amounts into short-term vs long-term
+                // Use FDs for short-term, mutual funds or stocks for long-term
+                // Suggest strategies like SIP, lump sum, etc.
             }},
 
-            "investment_plan": {{
-                "monthly_investment": "₹X",
-                "emergency_fund": "₹X",
+            "risk_management": ["...", "..."]
 
-                // emergency_fund = 5% of (monthly_income - monthly_expenses)
-                // monthly_investment = (monthly_income - monthly_expenses) - emergency_fund
+            // Examples: diversification, SIPs, low-volatility instruments, etc.
+            // Match suggestions based on risk appetite
+        }},
 
-                "goal_breakdown": {{
-                    "goal_1": {{"name": "Goal Name", "amount": "₹X", "strategy": "..."}},
-                    "goal_2": {{"name": "Goal Name", "amount": "₹X", "strategy": "..."}},
-                    ...(until all goals are covered)
+        "explanation": "Detailed explanation...",
 
-                    // Divide investment goal amounts into short-term vs long-term
-                    // Use FDs for short-term, mutual funds or stocks for long-term
-                    // Suggest strategies like SIP, lump sum, etc.
-                }},
+        "projected_returns": {{
+            "conservative": "X% CAGR",
+            "moderate": "X% CAGR",
+            "aggressive": "X% CAGR",
 
-                "risk_management": ["...", "..."]
+            "expected_value for stocks": "₹X in Y years",
+            "expected_value for mutual funds": "₹X in Y years",
+            "expected_value for fixed deposits": "₹X in Y years",
+            "total expected_value": "₹X in Y years"
+        }}
+    }}
 
-                // Examples: diversification, SIPs, low-volatility instruments, etc.
-                // Match suggestions based on risk appetite
-            }},
+    IMPORTANT:
 
-            "explanation": "Detailed explanation...",
+    1. For each instrument in suggested_instruments, include the full object with all its properties.
 
-            "projected_returns": {{
-                "conservative": "X% CAGR",
-                "moderate": "X% CAGR",
-                "aggressive": "X% CAGR",
+    2. Only suggest instruments that exist in the provided market data.
 
-                "expected_value for stocks": "₹X in Y years",
-                "expected_value for mutual funds": "₹X in Y years",
-                "expected_value for fixed deposits": "₹X in Y years",
-                "total expected_value": "₹X in Y years"
-            }}
-        }}
+    3. DO NOT pick instruments randomly. Select instruments **intelligently** based on:
+        - User's financial goals and timelines
+        - Risk appetite (conservative/moderate/aggressive)
+        - Monthly investment and allocation percentages
+        - Preference for return type (growth/safety)
 
-        IMPORTANT:
+    4. Instrument selection logic:
+        - Stocks: choose 2 companies with highest `growth_pct_yoy`
+        - Mutual Funds: pick 2 with highest `return_pct_3y_cagr`
+        - Fixed Deposits: pick 2 with highest `rate_pct`
+        - All instruments MUST come from the provided market_data.
 
-        1. For each instrument in suggested_instruments, include the full object with all its properties.
+    5. Monthly Investment:
+        - Calculate as: `monthly_income - monthly_expenses`
+        - Then deduct 5% of that value as emergency fund
+        - Final investment amount = 95% of (monthly_income - expenses)
 
-        2. Only suggest instruments that exist in the provided market data.
+    6. Emergency Fund:
+        - Compute and include in output as a separate field
+        - Value = 5% of (monthly_income - monthly_expenses)
 
-        3. DO NOT pick instruments randomly. Select instruments **intelligently** based on:
-            - User's financial goals and timelines
-            - Risk appetite (conservative/moderate/aggressive)
-            - Monthly investment and allocation percentages
-            - Preference for return type (growth/safety)
+    7. Projected Returns:
+        - Use compound interest formula: A = P * (1 + r)^t
+            - P = (monthly_investment × allocation %) * 12 
+            - r = average return of selected instruments for each category
+            - t = duration (Y years, inferred from user's goals)
+        - Provide expected_value for each category
+        - Sum them for total expected_value
+    """),
 
-        4. Instrument selection logic:
-            - Stocks: choose 2 companies with highest `growth_pct_yoy`
-            - Mutual Funds: pick 2 with highest `return_pct_3y_cagr`
-            - Fixed Deposits: pick 2 with highest `rate_pct`
-            - All instruments MUST come from the provided market_data.
+    ("human", """User Profile:
 
-        5. Monthly Investment:
-            - Calculate as: `monthly_income - monthly_expenses`
-            - Then deduct 5% of that value as emergency fund
-            - Final investment amount = 95% of (monthly_income - expenses)
+    {profile}
 
-        6. Emergency Fund:
-            - Compute and include in output as a separate field
-            - Value = 5% of (monthly_income - monthly_expenses)
+    Market Data:
 
-        7. Projected Returns:
-            - Use compound interest formula: A = P * (1 + r)^t
-                - P = (monthly_investment × allocation %) * 12 
-                - r = average return of selected instruments for each category
-                - t = duration (Y years, inferred from user's goals)
-            - Provide expected_value for each category
-            - Sum them for total expected_value
-        """),
+    {market_data}
 
-        ("human", """User Profile:
+    Risk Appetite: {risk_appetite}
+    Recommended Allocation: {allocation}
 
-        {profile}
+    Please provide a personalized investment recommendation in the exact JSON format specified above.
 
-        Market Data:
+    - For suggested_instruments, pick 2 items from each category in the market data.
+    - Keep the explanation brief and professional.
+    - The projected_returns_text should be a simple narrative.
+    """)
+])
 
-        {market_data}
+_CHAIN = _PROMPT | llm
 
-        Risk Appetite: {risk_appetite}
-        Recommended Allocation: {allocation}
+async def generate_recommendation(state: GraphState):
+    """Node to generate the investment recommendation based on the user's profile."""
+    print("---NODE: Generating Recommendation---")
+    # Merge the branch errors here, after both fetches have joined
+    errors = [e for e in (state.get("profile_error"), state.get("market_error")) if e]
+    if errors:
+        return {"error": "; ".join(errors)}
 
-        Please provide a personalized investment recommendation in the exact JSON format specified above.
+    profile = state['user_profile']
+    market = state['market_data']
 
-        - For suggested_instruments, pick 2 items from each category in the market data.
-        - Keep the explanation brief and professional.
-        - The projected_returns_text should be a simple narrative.
-        """)
-    ])
+    # One timestamp per invocation, shared by the payload and the DB row
+    generated_at = datetime.now().isoformat()
 
+    risk_appetite = profile.get("risk_appetite", "Medium")
 
+    # Pick the allocation for the risk profile
+    chosen_allocation = _ALLOCATIONS.get(risk_appetite, _ALLOCATIONS["Medium"])
 
     try:
-        # Format the market data to be more concise
+        # Format the market data to be more concise; islice takes the first
+        # five full objects without materializing a copy of the whole list
         formatted_market = {
-            "stocks": market.get("stocks", [])[:5],  # Return full stock objects
-            "mutual_funds": market.get("mutual_funds", [])[:5],  # Return full fund objects
-            "fixed_deposits": market.get("fixed_deposits", [])[:5]  # Return full FD objects
+            "stocks": list(islice(market.get("stocks") or (), 5)),
+            "mutual_funds": list(islice(market.get("mutual_funds") or (), 5)),
+            "fixed_deposits": list(islice(market.get("fixed_deposits") or (), 5))
         }
 
-        # Get the response from the LLM
-        chain = prompt | llm
-        response = chain.invoke({
-            "profile": json.dumps(profile, indent=2),
-            "market_data": json.dumps(formatted_market, indent=2),
+        # Stream the response from the LLM without blocking the event loop.
+        # Compact serialization keeps the prompt free of indentation
+        # whitespace, cutting input tokens and serialization time
+        # Tracking brace depth per chunk lets us stop consuming the stream
+        # (and start parsing) the moment the top-level JSON object closes,
+        # even if the model keeps emitting trailing text. Braces inside
+        # string values must not count, so the scanner carries in-string
+        # and escape state across chunks.
+        parts = []
+        depth = 0
+        started = False
+        complete = False
+        in_str = False
+        esc = False
+        async for chunk in _CHAIN.astream({
+            "profile": orjson.dumps(profile).decode(),
+            "market_data": orjson.dumps(formatted_market).decode(),
             "risk_appetite": risk_appetite,
-            "allocation": json.dumps(chosen_allocation, indent=2)
-        })
+            "allocation": orjson.dumps(dict(chosen_allocation)).decode()
+        }):
+            text = chunk.content
+            if not text:
+                continue
+            parts.append(text)
+            for ch in text:
+                if esc:
+                    esc = False
+                elif in_str:
+                    if ch == '\\':
+                        esc = True
+                    elif ch == '"':
+                        in_str = False
+                elif ch == '"':
+                    in_str = True
+                elif ch == '{':
+                    depth += 1
+                    started = True
+                elif ch == '}' and started:
+                    depth -= 1
+                    if depth == 0:
+                        complete = True
+                        break
+            if complete:
+                break
 
         # Parse the response
         # After getting the response from the LLM
         try:
             # Extract JSON from the response content
-            import re
-            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
-            if not json_match:
+            content = ''.join(parts)
+            start = content.find('{')
+            if start == -1:
                 raise ValueError("Could not parse JSON from response")
-                
-            recommendation = json.loads(json_match.group(0))
+
+            try:
+                recommendation, _ = _JSON_DECODER.raw_decode(content, start)
+            except json.JSONDecodeError:
+                # Fall back to the regex scan for responses with stray braces
+                json_match = _JSON_RE.search(content)
+                if not json_match:
+                    raise ValueError("Could not parse JSON from response")
+                recommendation = json.loads(json_match.group(0))
             recommendation['user_id'] = state['user_id']
+            recommendation['generated_at'] = generated_at
             
             # Validate the structure
             if 'suggested_instruments' not in recommendation:
@@ -281,7 +359,7 @@ def generate_recommendation(state: GraphState):
                     recommendation['suggested_instruments'][inst_type] = []
             
             # Save to database
-            if save_recommendation_to_db(recommendation):
+            if save_recommendation_to_db(recommendation, created_at=generated_at):
                 print("✅ Recommendation saved to database")
             else:
                 print("⚠️ Could not save recommendation to database")
@@ -296,60 +374,6 @@ def generate_recommendation(state: GraphState):
         print(f"❌ Error in generate_recommendation: {e}")
         return {"error": f"Failed to generate recommendation: {e}"}
 
-def save_recommendation_to_db(recommendation: Dict[str, Any]) -> bool:
-    """Save recommendation to SQLite database."""
-    conn = None
-    try:
-        conn = sqlite3.connect('db/financial_advisor.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        INSERT INTO recommendations (user_id, recommendation_json, created_at)
-        VALUES (?, ?, ?)
-        ''', (
-            recommendation['user_id'],
-            json.dumps(recommendation),
-            datetime.now().isoformat()
-        ))
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error saving recommendation to database: {e}")
-        return False
-    finally:
-        if conn:
-            conn.close()
-
-def get_user_recommendations(user_id: int, limit: int = 5) -> List[Dict[str, Any]]:
-    """Fetch user's past recommendations from the database."""
-    conn = None
-    try:
-        conn = sqlite3.connect('db/financial_advisor.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        SELECT id, user_id, recommendation_json, created_at 
-        FROM recommendations 
-        WHERE user_id = ? 
-        ORDER BY created_at DESC 
-        LIMIT ?
-        ''', (user_id, limit))
-        
-        results = []
-        for row in cursor.fetchall():
-            rec = dict(row)
-            rec['recommendation_json'] = json.loads(rec['recommendation_json'])
-            results.append(rec)
-        return results
-    except Exception as e:
-        print(f"Error fetching recommendations: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
-
 # --- 3. Build the Graph ---
 workflow = StateGraph(GraphState)
 
@@ -358,15 +382,13 @@ workflow.add_node("fetch_user_profile", fetch_user_profile)
 workflow.add_node("fetch_market_data", fetch_market_data)
 workflow.add_node("generate_recommendation", generate_recommendation)
 
-# Define the edges
+# Define the edges: the profile and market fetches are independent I/O,
+# so fan out from START and join before generating the recommendation
 workflow.add_edge(START, "fetch_user_profile")
-workflow.add_edge("fetch_user_profile", "fetch_market_data")
-workflow.add_edge("fetch_market_data", "generate_recommendation")
+workflow.add_edge(START, "fetch_market_data")
+workflow.add_edge(["fetch_user_profile", "fetch_market_data"], "generate_recommendation")
 workflow.add_edge("generate_recommendation", END)
 
-# Set the entry point
-workflow.set_entry_point("fetch_user_profile")
-
 # Compile the workflow
 app = workflow.compile()
 
@@ -392,10 +414,10 @@ if __name__ == "__main__":
                 final_state = {"recommendation": existing_recs[0]["recommendation_json"]}
             else:
                 print("Generating new recommendation...")
-                final_state = app.invoke(inputs)
+                final_state = asyncio.run(app.ainvoke(inputs))
         else:
             print("No existing recommendations found. Generating new one...")
-            final_state = app.invoke(inputs)
+            final_state = asyncio.run(app.ainvoke(inputs))
         
         # Display the final recommendation
         if "recommendation" in final_state and final_state.get("recommendation"):
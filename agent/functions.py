@@ -1,9 +1,47 @@
 from typing import Dict, Any, List, Optional
+from collections import OrderedDict
 from datetime import datetime
+import asyncio
+import heapq
 import json
+import logging
+import os
 import sqlite3
+import threading
+import time
+import numpy as np
+import orjson
 from tools import get_all_tools
-from models import GraphState, DEFAULT_ALLOCATIONS, RISK_PROFILES
+from models import (GraphState, DEFAULT_ALLOCATIONS, RISK_PROFILES, UserProfile,
+                    Stock, MutualFund, FixedDeposit)
+from recommendations_db import save_recommendation_to_db, save_recommendations_bulk
+
+# Node tracing goes through the logging module so production runs (default
+# INFO) skip the per-request f-string formatting and stdout locking that
+# unconditional log.debug() calls paid on every node
+logging.basicConfig(level=os.environ.get("FINADVISOR_LOG_LEVEL", "INFO").upper())
+log = logging.getLogger(__name__)
+
+# Frozen membership sets so the per-call validity checks below are a single
+# hash lookup against a constant, with no dict construction per request
+_VALID_RISK_PROFILES = frozenset(RISK_PROFILES)
+_VALID_ALLOCATIONS = frozenset(DEFAULT_ALLOCATIONS)
+
+# Required profile fields, checked via set difference in C instead of a
+# per-field membership loop. The fetch nodes need the base trio; the
+# completeness check additionally requires the horizon.
+_REQUIRED_FETCH_FIELDS = frozenset(
+    ["monthly_income", "monthly_expenses", "risk_appetite"])
+_REQUIRED_PROFILE_FIELDS = _REQUIRED_FETCH_FIELDS | {"investment_horizon_years"}
+
+# Constant recommendation content, frozen as tuples so the fallback and
+# default-goals paths don't rebuild the same string lists per request
+_FALLBACK_ACTIONS = (
+    "Update your financial information",
+    "Set clear investment goals",
+    "Complete your risk assessment"
+)
+_DEFAULT_GOALS = ("Wealth accumulation", "Retirement planning")
 
 # Initialize tools
 tools = get_all_tools()
@@ -11,71 +49,191 @@ user_profile_tool = tools[0]  # UserProfileTool
 market_data_tool = tools[1]   # MarketDataTool
 portfolio_tool = tools[2]     # PortfolioTool
 
+# Profiles rarely change between back-to-back graph runs, so repeat lookups
+# for the same user are served from memory instead of hitting SQLite again.
+# Manual LRU rather than lru_cache: error payloads (transient DB failures,
+# missing profiles) must not be pinned, and callers get a copy so their
+# in-place coercions can't corrupt the cached entry. Any code path that
+# writes a profile must call invalidate_user_caches() so the next read
+# sees fresh data.
+_profile_cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+_PROFILE_CACHE_MAX = 1024
+
+def _cached_profile(user_id: int) -> Dict[str, Any]:
+    cached = _profile_cache.get(user_id)
+    if cached is not None:
+        _profile_cache.move_to_end(user_id)
+        return dict(cached)
+    data = user_profile_tool._run(user_id)
+    if isinstance(data, dict) and "error" not in data:
+        _profile_cache[user_id] = dict(data)
+        while len(_profile_cache) > _PROFILE_CACHE_MAX:
+            _profile_cache.popitem(last=False)
+    return data
+
+def _coerce_profile_numerics(data: Dict[str, Any]) -> None:
+    """Normalize numeric profile fields in place at the fetch boundary.
+
+    Doing the string->number parse once here lets every downstream node
+    read the values directly instead of re-running float() per node.
+    """
+    for k in ("monthly_income", "monthly_expenses"):
+        if data.get(k) is not None:
+            data[k] = float(data[k])
+    if data.get("investment_horizon_years") is not None:
+        data["investment_horizon_years"] = int(data["investment_horizon_years"])
+
+# Market snapshots change on the order of minutes, not per request, so a
+# short TTL cache saves one round-trip per graph run. The lock ensures only
+# one caller refreshes an expired snapshot at a time.
+_market_cache = {"ts": 0.0, "data": None}
+_market_lock = threading.Lock()
+
+# Timestamps in node metadata only need second granularity, so the
+# isoformat string is reformatted at most once per second instead of on
+# every request
+_ts_cache = [0.0, ""]
+
+def _iso_now_cached() -> str:
+    t = time.time()
+    if t - _ts_cache[0] >= 1.0:
+        _ts_cache[:] = [t, datetime.fromtimestamp(t).isoformat()]
+    return _ts_cache[1]
+
+def _top_k(items: List[Dict[str, Any]], scores, k: int) -> List[Dict[str, Any]]:
+    """Return the k highest-scored items using argpartition.
+
+    scores is a parallel NumPy array (one float per item), so selection is
+    an O(N) partition over a contiguous column instead of comparing dicts.
+    Results come back in descending score order.
+    """
+    n = len(items)
+    if n == 0:
+        return []
+    if n <= k:
+        idx = np.argsort(-scores)
+    else:
+        idx = np.argpartition(-scores, k)[:k]
+        idx = idx[np.argsort(-scores[idx])]
+    return [items[i] for i in idx]
+
+# Within one market snapshot the whole pipeline is deterministic per user,
+# so finished recommendations are memoized on (user_id, snapshot ts) and the
+# graph short-circuits on a hit, skipping every downstream node including
+# the LLM call. Bounded LRU; dropped on profile writes.
+_reco_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_RECO_CACHE_MAX = 1024
+
+def _reco_cache_get(user_id: int) -> Optional[Dict[str, Any]]:
+    key = (user_id, _market_cache["ts"])
+    rec = _reco_cache.get(key)
+    if rec is not None:
+        _reco_cache.move_to_end(key)
+    return rec
+
+def _reco_cache_put(user_id: int, recommendation: Dict[str, Any]) -> None:
+    key = (user_id, _market_cache["ts"])
+    _reco_cache[key] = recommendation
+    _reco_cache.move_to_end(key)
+    while len(_reco_cache) > _RECO_CACHE_MAX:
+        _reco_cache.popitem(last=False)
+
+def invalidate_user_caches(user_id: Optional[int] = None) -> None:
+    """Drop cached profile data and memoized recommendations.
+
+    Call after any profile write so subsequent graph runs see fresh data.
+    """
+    if user_id is None:
+        _profile_cache.clear()
+        _reco_cache.clear()
+    else:
+        _profile_cache.pop(user_id, None)
+        for key in [k for k in _reco_cache if k[0] == user_id]:
+            del _reco_cache[key]
+
+def _ensure_state(state: Any) -> Dict[str, Any]:
+    """Validate the state shape once at graph ingress.
+
+    The entry nodes call this so every downstream node can rely on the
+    dict invariant instead of re-checking isinstance per node per request.
+    """
+    return state if isinstance(state, dict) else {}
+
+def _parse_tenure(tenure: str) -> int:
+    """Normalize a tenure string like '1 year' or '18 months' to months."""
+    try:
+        value = int(str(tenure).split()[0])
+    except (ValueError, IndexError):
+        return 12
+    return value * 12 if "year" in str(tenure) else value
+
+def _get_market(ttl: float = 60.0) -> Dict[str, Any]:
+    now = time.monotonic()
+    if _market_cache["data"] is None or now - _market_cache["ts"] > ttl:
+        with _market_lock:
+            # Re-check under the lock in case another thread just refreshed
+            now = time.monotonic()
+            if _market_cache["data"] is None or now - _market_cache["ts"] > ttl:
+                _market_cache["data"] = market_data_tool._run()
+                _market_cache["ts"] = now
+    return _market_cache["data"]
+
 def fetch_user_profile(state: GraphState) -> Dict[str, Any]:
     """Node to fetch user profile."""
-    print("---NODE: Fetching User Profile---")
+    log.debug("---NODE: Fetching User Profile---")
     try:
-        # Ensure we have a valid state
-        if not isinstance(state, dict):
-            state = {}
-            
+        state = _ensure_state(state)
         user_id = state.get("user_id")
         if not user_id:
             return {
-                **state,
                 "error": "No user_id provided in state",
                 "status": "error"
             }
             
-        print(f"🛠️ TOOL: Fetching profile for user_id: {user_id}")
-        data = user_profile_tool._run(user_id)
+        log.debug("🛠️ TOOL: Fetching profile for user_id: %s", user_id)
+        data = _cached_profile(user_id)
         
         if "error" in data:
             error_msg = f"Failed to fetch user profile: {data['error']}"
-            print(f"ERROR: {error_msg}")
+            log.error(error_msg)
             return {
-                **state,
                 "error": error_msg,
                 "status": "error"
             }
         
         if not isinstance(data, dict):
             error_msg = "Invalid profile data format"
-            print(f"ERROR: {error_msg}")
+            log.error(error_msg)
             return {
-                **state,
                 "error": error_msg,
                 "status": "error"
             }
             
         # Ensure required fields are present
-        required_fields = ['monthly_income', 'monthly_expenses', 'risk_appetite']
-        missing_fields = [field for field in required_fields if field not in data or data[field] is None]
+        present = {k for k, v in data.items() if v is not None}
+        missing_fields = _REQUIRED_FETCH_FIELDS - present
         
         if missing_fields:
-            error_msg = f"Profile is missing required fields: {', '.join(missing_fields)}"
-            print(f"ERROR: {error_msg}")
+            error_msg = f"Profile is missing required fields: {', '.join(sorted(missing_fields))}"
+            log.error(error_msg)
             return {
-                **state,
                 "error": error_msg,
                 "status": "error"
             }
             
-        # Return updated state with user profile
-        new_state = {
-            **state,
+        _coerce_profile_numerics(data)
+
+        log.debug("✅ Successfully fetched profile for user_id: %s", user_id)
+        # Return only the changed keys; the graph reducer merges the delta
+        return {
             "user_profile": data,
             "status": "success"  # Changed from 'profile_fetched' to 'success' for consistency
         }
         
-        print(f"✅ Successfully fetched profile for user_id: {user_id}")
-        return new_state
-        
     except Exception as e:
         error_msg = f"Failed to fetch user profile: {str(e)}"
-        print(f"ERROR in fetch_user_profile: {error_msg}")
+        log.error("fetch_user_profile: %s", error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
@@ -97,96 +255,74 @@ def calculate_savings(monthly_income: float, monthly_expenses: float) -> Dict[st
 
 def check_profile_completeness(state: GraphState) -> Dict[str, Any]:
     """Check if user profile is complete and valid."""
-    print("---NODE: Checking Profile Completeness---")
-    
-    # Ensure we have a valid state and profile
-    if not isinstance(state, dict):
-        state = {}
+    log.debug("---NODE: Checking Profile Completeness---")
     
+    # State shape is guaranteed by _ensure_state at graph ingress
     profile = state.get("user_profile", {})
     if not isinstance(profile, dict):
-        return {
-            **state,
+        return state | {
             "error": "Invalid profile data format",
             "status": "error"
         }
     
-    # Required base fields (excluding derived fields)
-    required_fields = [
-        'monthly_income', 'monthly_expenses',
-        'risk_appetite', 'investment_horizon_years'
-    ]
-    
-    # Check for missing base fields
-    missing = [field for field in required_fields 
-              if field not in profile or profile[field] is None]
+    # Check for missing base fields (excluding derived fields) via set
+    # difference against the frozen requirement set
+    present = {k for k, v in profile.items() if v is not None}
+    missing = sorted(_REQUIRED_PROFILE_FIELDS - present)
     
     if missing:
-        print(f"Profile incomplete. Missing fields: {', '.join(missing)}")
-        return {
-            **state,
+        log.debug("Profile incomplete. Missing fields: %s", ", ".join(missing))
+        return state | {
             "status": "profile_incomplete",
             "missing_fields": missing,
             "error": f"Missing required fields: {', '.join(missing)}"
         }
     
     try:
-        # Convert numeric fields to float
-        monthly_income = float(profile['monthly_income'])
-        monthly_expenses = float(profile['monthly_expenses'])
-        
+        # Validate and coerce the numeric fields and risk profile in one
+        # pydantic pass instead of scattered float()/.get() checks
+        validated = UserProfile(
+            monthly_income=profile['monthly_income'],
+            monthly_expenses=profile['monthly_expenses'],
+            risk_appetite=profile['risk_appetite'],
+            investment_horizon_years=profile['investment_horizon_years']
+        )
+        profile['risk_appetite'] = validated.risk_appetite
+
         # Calculate derived fields
-        savings_info = calculate_savings(monthly_income, monthly_expenses)
+        savings_info = calculate_savings(validated.monthly_income, validated.monthly_expenses)
         if savings_info:
             profile.update(savings_info)
-        
+
         # Set default investment goals if not provided
         if 'investment_goals' not in profile or not profile['investment_goals']:
-            profile['investment_goals'] = ["Wealth accumulation", "Retirement planning"]
-        
-        # Normalize risk profile
-        risk_appetite = str(profile.get('risk_appetite', '')).strip()
-        risk_mapping = {
-            'low': 'Low',
-            'medium': 'Medium',
-            'high': 'High'
-        }
-        
-        risk_appetite_lower = risk_appetite.lower()
-        if risk_appetite_lower not in risk_mapping:
-            raise ValueError(f"Invalid risk profile: {risk_appetite}")
-        
-        normalized_risk = risk_mapping[risk_appetite_lower]
-        profile['risk_appetite'] = normalized_risk
-        
+            profile['investment_goals'] = list(_DEFAULT_GOALS)
+
         # Update the state with processed profile
         state["user_profile"] = profile
         
-        return {
-            **state,
+        return state | {
             "status": "profile_valid"
         }
         
     except ValueError as ve:
         error_msg = f"Invalid profile data: {str(ve)}"
-        print(f"ERROR: {error_msg}")
-        return {
-            **state,
+        log.error(error_msg)
+        return state | {
             "status": "profile_invalid",
             "error": error_msg
         }
     except Exception as e:
         error_msg = f"Error processing profile: {str(e)}"
-        print(f"ERROR: {error_msg}")
-        return {
-            **state,
+        log.error(error_msg)
+        return state | {
             "status": "error",
             "error": error_msg
         }
 
 def generate_fallback_recommendation(state: GraphState) -> Dict[str, Any]:
     """Generate a basic recommendation when profile is incomplete."""
-    print("---NODE: Generating Fallback Recommendation---")
+    log.debug("---NODE: Generating Fallback Recommendation---")
     
     # Get the reason for the fallback
     status = state.get("status", "profile_incomplete")
@@ -199,17 +335,12 @@ def generate_fallback_recommendation(state: GraphState) -> Dict[str, Any]:
     elif status == "profile_invalid":
         message = state.get("error", "Invalid profile information provided.")
     
-    return {
-        **state,
+    return state | {
         "recommendation": {
             "status": "fallback",
             "message": message,
-            "suggested_actions": [
-                "Update your financial information",
-                "Set clear investment goals",
-                "Complete your risk assessment"
-            ],
-            "generated_at": datetime.now().isoformat(),
+            "suggested_actions": list(_FALLBACK_ACTIONS),
+            "generated_at": _iso_now_cached(),
             "user_id": state.get("user_id")
         },
         "status": "completed_with_fallback"
@@ -217,64 +348,152 @@ def generate_fallback_recommendation(state: GraphState) -> Dict[str, Any]:
 
 def fetch_market_data(state: GraphState) -> Dict[str, Any]:
     """Node to fetch market data."""
-    print("---NODE: Fetching Market Data---")
+    log.debug("---NODE: Fetching Market Data---")
     try:
-        # Ensure we have a valid state
-        if not isinstance(state, dict):
-            state = {}
-            
-        print("🛠️ TOOL: Fetching market data...")
-        data = market_data_tool._run()
+        state = _ensure_state(state)
+        log.debug("🛠️ TOOL: Fetching market data...")
+        data = _get_market()
         
         if not isinstance(data, dict):
             raise ValueError("Invalid market data format")
             
         if "error" in data:
             error_msg = f"Market data error: {data['error']}"
-            print(f"ERROR: {error_msg}")
+            log.error(error_msg)
             return {
-                **state,
                 "error": error_msg,
                 "status": "error"
             }
             
-        print("✅ TOOL: Successfully fetched market data.")
+        log.debug("✅ TOOL: Successfully fetched market data.")
         return {
-            **state,
             "market_data": data, 
             "status": "market_data_fetched"
         }
         
     except Exception as e:
         error_msg = f"Failed to fetch market data: {str(e)}"
-        print(f"ERROR in fetch_market_data: {error_msg}")
+        log.error("fetch_market_data: %s", error_msg)
+        return {
+            "error": error_msg,
+            "status": "error"
+        }
+
+async def fetch_independent(state: GraphState) -> Dict[str, Any]:
+    """Fetch the user profile and market data concurrently.
+
+    The two lookups share no data dependency, so they run in a single
+    asyncio.gather phase instead of two sequential graph nodes.
+    """
+    log.debug("---NODE: Fetching Profile and Market Data---")
+    try:
+        state = _ensure_state(state)
+        user_id = state.get("user_id")
+        if not user_id:
+            return {
+                "error": "No user_id provided in state",
+                "status": "error"
+            }
+
+        log.debug("🛠️ TOOL: Fetching profile and market data for user_id: %s", user_id)
+        profile_data, market_data = await asyncio.gather(
+            asyncio.to_thread(_cached_profile, user_id),
+            asyncio.to_thread(_get_market)
+        )
+
+        if "error" in profile_data:
+            error_msg = f"Failed to fetch user profile: {profile_data['error']}"
+            log.error(error_msg)
+            return {
+                "error": error_msg,
+                "status": "error"
+            }
+
+        # Ensure required profile fields are present
+        present = {k for k, v in profile_data.items() if v is not None}
+        missing_fields = _REQUIRED_FETCH_FIELDS - present
+
+        if missing_fields:
+            error_msg = f"Profile is missing required fields: {', '.join(sorted(missing_fields))}"
+            log.error(error_msg)
+            return {
+                "error": error_msg,
+                "status": "error"
+            }
+
+        if not isinstance(market_data, dict):
+            raise ValueError("Invalid market data format")
+
+        if "error" in market_data:
+            error_msg = f"Market data error: {market_data['error']}"
+            log.error(error_msg)
+            return {
+                "error": error_msg,
+                "status": "error"
+            }
+
+        # Same user within the same market snapshot: reuse the memoized
+        # recommendation and skip the rest of the pipeline entirely
+        cached_rec = _reco_cache_get(user_id)
+        if cached_rec is not None:
+            log.debug("✅ Recommendation cache hit for user_id: %s", user_id)
+            return {
+                "user_profile": profile_data,
+                "market_data": market_data,
+                "recommendation": cached_rec,
+                "status": "cache_hit"
+            }
+
+        _coerce_profile_numerics(profile_data)
+
+        log.debug("✅ Successfully fetched profile and market data for user_id: %s", user_id)
+        return {
+            "user_profile": profile_data,
+            "market_data": market_data,
+            "status": "success"
+        }
+
+    except Exception as e:
+        error_msg = f"Failed to fetch profile and market data: {str(e)}"
+        log.error("fetch_independent: %s", error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
 
 def preprocess_market_data(state: GraphState) -> Dict[str, Any]:
     """Preprocess and filter market data based on user profile."""
-    print("---NODE: Preprocessing Market Data---")
+    log.debug("---NODE: Preprocessing Market Data---")
     try:
-        # Ensure we have a valid state
-        if not isinstance(state, dict):
-            state = {}
-            
         market_data = state.get("market_data", {})
         user_profile = state.get("user_profile", {})
         
         if not market_data:
             raise ValueError("No market data available for processing")
         
+        # Pre-cast FD interest rates and normalize tenures once so the
+        # selection loop doesn't repeat float()/str parsing per product
+        fixed_deposits = [
+            {**fd,
+             "interest_rate": float(fd.get("interest_rate", 0)),
+             "_tenure_months": _parse_tenure(fd.get("tenure", "12"))}
+            for fd in market_data.get("fixed_deposits", [])
+        ]
+
         # Add any preprocessing logic here (filtering, sorting, etc.)
         processed_data = {
             "stocks": market_data.get("stocks", []),
             "mutual_funds": market_data.get("mutual_funds", []),
-            "fixed_deposits": market_data.get("fixed_deposits", [])
+            "fixed_deposits": fixed_deposits
         }
-        
+
+        # Bucket mutual funds by category once so selectors do an O(1)
+        # lookup instead of re-scanning the full list per call
+        by_cat = {}
+        for mf in processed_data["mutual_funds"]:
+            by_cat.setdefault(mf.get("category", "unknown"), []).append(mf)
+        processed_data["mutual_funds_by_category"] = by_cat
+
         # Add any additional processing based on user profile
         risk_profile = user_profile.get("risk_appetite", "Medium").lower()
         
@@ -284,18 +503,31 @@ def preprocess_market_data(state: GraphState) -> Dict[str, Any]:
         elif risk_profile == "high":
             # Include all stocks for high-risk profiles
             pass
+
+        # Structure-of-arrays score columns (built after any risk filtering)
+        # so top-k selection partitions a contiguous float array instead of
+        # calling .get() on every dict per comparison
+        stocks_list = processed_data["stocks"]
+        processed_data["stock_caps"] = np.fromiter(
+            (stk.get("market_cap", 0) for stk in stocks_list),
+            dtype=np.float64, count=len(stocks_list))
+        debt_funds = by_cat.get("debt", [])
+        processed_data["debt_mf_returns"] = np.fromiter(
+            (mf.get("returns_5y", 0) for mf in debt_funds),
+            dtype=np.float64, count=len(debt_funds))
+        processed_data["fd_rates"] = np.fromiter(
+            (fd["interest_rate"] for fd in fixed_deposits),
+            dtype=np.float64, count=len(fixed_deposits))
         
         return {
-            **state,
             "processed_market_data": processed_data, 
             "status": "market_data_processed"
         }
         
     except Exception as e:
         error_msg = f"Error processing market data: {str(e)}"
-        print(f"ERROR: {error_msg}")
+        log.error(error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
@@ -307,18 +539,15 @@ def calculate_emergency_fund(state: GraphState) -> Dict[str, Any]:
     Emergency fund = 5% of (monthly_income - monthly_expenses)
     Monthly investment = 95% of (monthly_income - monthly_expenses)
     """
-    print("---NODE: Calculating Emergency Fund and Monthly Investment---")
+    log.debug("---NODE: Calculating Emergency Fund and Monthly Investment---")
     
     try:
-        # Ensure we have a valid state
-        if not isinstance(state, dict):
-            state = {}
-            
         profile = state.get("user_profile", {})
         
         # Get monthly income and expenses, default to 0 if not provided
-        monthly_income = float(profile.get("monthly_income", 0))
-        monthly_expenses = float(profile.get("monthly_expenses", 0))
+        # (already coerced to float at the fetch boundary)
+        monthly_income = profile.get("monthly_income", 0)
+        monthly_expenses = profile.get("monthly_expenses", 0)
         
         # Calculate disposable income
         disposable_income = monthly_income - monthly_expenses
@@ -332,8 +561,8 @@ def calculate_emergency_fund(state: GraphState) -> Dict[str, Any]:
         # Calculate monthly investment (95% of disposable income)
         monthly_investment = round(disposable_income * 0.95, 2)
         
-        print(f"💰 Emergency Fund: ₹{emergency_fund:,.2f}")
-        print(f"💵 Monthly Investment: ₹{monthly_investment:,.2f}")
+        log.debug("💰 Emergency Fund: ₹%.2f", emergency_fund)
+        log.debug("💵 Monthly Investment: ₹%.2f", monthly_investment)
         
         # Update the profile with the calculated values
         updated_profile = {
@@ -343,7 +572,6 @@ def calculate_emergency_fund(state: GraphState) -> Dict[str, Any]:
         }
         
         return {
-            **state,
             "user_profile": updated_profile,
             "emergency_fund": emergency_fund,
             "monthly_investment": monthly_investment,
@@ -352,29 +580,27 @@ def calculate_emergency_fund(state: GraphState) -> Dict[str, Any]:
         
     except ValueError as ve:
         error_msg = str(ve)
-        print(f"ERROR: {error_msg}")
+        log.error(error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
     except Exception as e:
         error_msg = f"Error calculating emergency fund: {str(e)}"
-        print(f"ERROR: {error_msg}")
+        log.error(error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
 
 def analyze_goals_and_risk(state: GraphState) -> GraphState:
     """Analyze user's financial goals and determine risk profile."""
-    print("---NODE: Analyzing Goals and Risk---")
+    log.debug("---NODE: Analyzing Goals and Risk---")
     profile = state.get("user_profile", {})
     
     # Get risk profile from user profile, default to 'moderate'
     risk_profile = profile.get("risk_appetite", "moderate").lower()
-    if risk_profile not in RISK_PROFILES:
+    if risk_profile not in _VALID_RISK_PROFILES:
         risk_profile = "moderate"
     
     # Get time horizon in years, default to 5 years
@@ -388,19 +614,15 @@ def analyze_goals_and_risk(state: GraphState) -> GraphState:
 
 def define_risk_based_allocation(state: GraphState) -> Dict[str, Any]:
     """Define asset allocation based on risk profile."""
-    print("---NODE: Defining Risk-Based Allocation---")
+    log.debug("---NODE: Defining Risk-Based Allocation---")
     
     try:
-        # Ensure we have a valid state
-        if not isinstance(state, dict):
-            state = {}
-            
         # Get risk profile from state, default to 'medium' if not found
         risk_profile = state.get("risk_profile", "medium").lower()
         
         # Validate risk profile
-        if risk_profile not in DEFAULT_ALLOCATIONS:
-            print(f"Warning: Invalid risk profile '{risk_profile}'. Using 'medium' as default.")
+        if risk_profile not in _VALID_ALLOCATIONS:
+            log.warning("Warning: Invalid risk profile '%s'. Using 'medium' as default.", risk_profile)
             risk_profile = "medium"
         
         # Get the allocation for the risk profile
@@ -408,20 +630,18 @@ def define_risk_based_allocation(state: GraphState) -> Dict[str, Any]:
         
         # Add metadata
         allocation["risk_profile"] = risk_profile
-        allocation["last_updated"] = datetime.now().isoformat()
+        allocation["last_updated"] = _iso_now_cached()
         
-        print(f"✅ Defined allocation for risk profile: {risk_profile}")
+        log.debug("✅ Defined allocation for risk profile: %s", risk_profile)
         return {
-            **state,
             "asset_allocation": allocation,
             "status": "allocation_defined"
         }
         
     except Exception as e:
         error_msg = f"Error defining risk-based allocation: {str(e)}"
-        print(f"ERROR: {error_msg}")
+        log.error(error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
@@ -436,12 +656,12 @@ def select_investment_products(state: GraphState) -> Dict[str, Any]:
     Returns:
         Updated state with selected investment products and allocations
     """
-    print("---NODE: Selecting Investment Products---")
+    log.debug("---NODE: Selecting Investment Products---")
     
     # Debug: Print current state keys and user profile keys
-    print(f"Current state keys: {list(state.keys())}")
+    log.debug("Current state keys: %s", list(state.keys()))
     user_profile = state.get("user_profile", {})
-    print(f"User profile keys: {list(user_profile.keys())}")
+    log.debug("User profile keys: %s", list(user_profile.keys()))
     
     try:
         # Get the monthly investment amount from the state or user profile
@@ -449,13 +669,13 @@ def select_investment_products(state: GraphState) -> Dict[str, Any]:
         if monthly_investment is None:
             monthly_investment = user_profile.get("monthly_investment")
             if monthly_investment is None:
-                # Calculate monthly investment if not set
-                monthly_income = float(user_profile.get("monthly_income", 0))
-                monthly_expenses = float(user_profile.get("monthly_expenses", 0))
+                # Calculate monthly investment if not set; income/expenses
+                # were coerced to float at the fetch boundary
+                monthly_income = user_profile.get("monthly_income", 0)
+                monthly_expenses = user_profile.get("monthly_expenses", 0)
                 monthly_investment = (monthly_income - monthly_expenses) * 0.95  # 95% of disposable income
         
-        monthly_investment = float(monthly_investment)
-        print(f"Monthly investment from state: {monthly_investment}")
+        log.debug("Monthly investment from state: %s", monthly_investment)
         
         if monthly_investment <= 0:
             raise ValueError("No monthly investment amount available")
@@ -467,28 +687,18 @@ def select_investment_products(state: GraphState) -> Dict[str, Any]:
             "cash": 0.1
         })
         
-        equity_ratio = allocation.get("equity", 0.6)
-        fixed_income_ratio = allocation.get("fixed_income", 0.3)
-        cash_ratio = allocation.get("cash", 0.1)
-        
-        # Ensure ratios sum to 1
-        total_ratio = equity_ratio + fixed_income_ratio + cash_ratio
-        if total_ratio > 0:
-            equity_ratio /= total_ratio
-            fixed_income_ratio /= total_ratio
-            cash_ratio /= total_ratio
-        
-        # Calculate amounts for each asset class
-        equity_amount = monthly_investment * equity_ratio
-        fixed_income_amount = monthly_investment * fixed_income_ratio
-        cash_amount = monthly_investment * cash_ratio
+        # Normalize the ratios and split the investment in one vector op
+        equity_amount, fixed_income_amount, _, cash_amount = _split_allocation(
+            monthly_investment, allocation
+        )
         
-        print(f"📊 Allocation: Equity: ₹{equity_amount:,.2f}, "
-              f"Fixed Income: ₹{fixed_income_amount:,.2f}, "
-              f"Cash: ₹{cash_amount:,.2f}")
+        log.debug("📊 Allocation: Equity: ₹%.2f, Fixed Income: ₹%.2f, Cash: ₹%.2f",
+                  equity_amount, fixed_income_amount, cash_amount)
         
-        # Get market data
-        market_data = state.get("market_data", {})
+        # Get market data (preprocessed when available: FD rates pre-cast
+        # and mutual funds already bucketed by category)
+        market_data = state.get("processed_market_data") or state.get("market_data", {})
+        mfs_by_category = market_data.get("mutual_funds_by_category")
         
         # Initialize selected products with empty lists
         selected_products = {
@@ -497,157 +707,218 @@ def select_investment_products(state: GraphState) -> Dict[str, Any]:
             "fixed_deposits": [],
             "total_allocated": 0
         }
-        
-        # Select stocks for equity allocation
+
+        # Per-class subtotals tracked as the lists are built, so the total
+        # needs no second pass over the selections
+        equity_alloc = fixed_income_alloc = cash_alloc = 0.0
+
+        # Each class builds its selected_products entries and the matching
+        # suggested_instruments entries in one pass per product
+        stock_instruments: List[Dict[str, Any]] = []
+        mf_instruments: List[Dict[str, Any]] = []
+        fd_instruments: List[Dict[str, Any]] = []
+        pct_factor = 100.0 / monthly_investment if monthly_investment > 0 else 0.0
+        
+        # Select stocks for equity allocation. The preprocessed score
+        # column lets argpartition do an O(N) top-k; otherwise fall back to
+        # a decorated nlargest (O(N log k), still beats a full sort).
         if equity_amount > 0:
-            stocks = sorted(
-                market_data.get("stocks", []),
-                key=lambda x: x.get("market_cap", 0),
-                reverse=True
-            )
-            
+            stock_list = market_data.get("stocks", [])
+            stock_caps = market_data.get("stock_caps")
+            if stock_caps is not None and len(stock_caps) == len(stock_list):
+                stocks = _top_k(stock_list, stock_caps, 5)
+            else:
+                scored = [(stk.get("market_cap", 0), i, stk)
+                          for i, stk in enumerate(stock_list)]
+                stocks = [stk for _, _, stk in heapq.nlargest(5, scored)]
+
             # Distribute equity amount among top 5 stocks
-            num_stocks = min(5, len(stocks))
+            num_stocks = len(stocks)
             if num_stocks > 0:
                 per_stock = round(equity_amount / num_stocks, 2)
-                selected_products["stocks"] = [
-                    {**stock, "allocation_amount": per_stock}
-                    for stock in stocks[:num_stocks]
-                ]
-        
+                equity_alloc = per_stock * num_stocks
+                stock_pct = per_stock * pct_factor
+                for stock in stocks:
+                    selected_products["stocks"].append(
+                        {**stock, "allocation_amount": per_stock})
+                    stock_instruments.append({
+                        "name": stock.get("name", stock.get("symbol", "Unknown")),
+                        "allocation_percentage": stock_pct,
+                        "reason": f"Selected based on market cap in {stock.get('sector', 'various')} sector"
+                    })
+
         # Select mutual funds for fixed income allocation
         if fixed_income_amount > 0:
-            mfs = sorted(
-                [mf for mf in market_data.get("mutual_funds", []) 
-                 if mf.get("category") == "debt"],
-                key=lambda x: x.get("returns_5y", 0),
-                reverse=True
-            )
-            
+            if mfs_by_category is not None:
+                debt_funds = mfs_by_category.get("debt", [])
+            else:
+                debt_funds = [mf for mf in market_data.get("mutual_funds", [])
+                              if mf.get("category") == "debt"]
+            mf_returns = market_data.get("debt_mf_returns")
+            if mf_returns is not None and len(mf_returns) == len(debt_funds):
+                mfs = _top_k(debt_funds, mf_returns, 3)
+            else:
+                scored = [(mf.get("returns_5y", 0), i, mf)
+                          for i, mf in enumerate(debt_funds)]
+                mfs = [mf for _, _, mf in heapq.nlargest(3, scored)]
+
             # Distribute fixed income amount among top 3 funds
-            num_mfs = min(3, len(mfs))
+            num_mfs = len(mfs)
             if num_mfs > 0:
                 per_mf = round(fixed_income_amount / num_mfs, 2)
-                selected_products["mutual_funds"] = [
-                    {**mf, "allocation_amount": per_mf}
-                    for mf in mfs[:num_mfs]
-                ]
-        
+                fixed_income_alloc = per_mf * num_mfs
+                mf_pct = per_mf * pct_factor
+                for mf in mfs:
+                    selected_products["mutual_funds"].append(
+                        {**mf, "allocation_amount": per_mf})
+                    mf_instruments.append({
+                        "name": mf.get("scheme_name", "Unknown Fund"),
+                        "allocation_percentage": mf_pct,
+                        "reason": f"Selected based on historical returns in {mf.get('category', 'various')} category"
+                    })
+
         # Select fixed deposits for cash allocation
         if cash_amount > 0:
-            fds = sorted(
-                market_data.get("fixed_deposits", []),
-                key=lambda x: float(x.get("interest_rate", 0)),
-                reverse=True
-            )
-            
+            fd_list = market_data.get("fixed_deposits", [])
+            fd_rates = market_data.get("fd_rates")
+            if fd_rates is not None and len(fd_rates) == len(fd_list):
+                fds = _top_k(fd_list, fd_rates, 3)
+            else:
+                scored = [(float(fd.get("interest_rate", 0)), i, fd)
+                          for i, fd in enumerate(fd_list)]
+                fds = [fd for _, _, fd in heapq.nlargest(3, scored)]
+
             # Distribute cash amount among top 3 FDs
-            num_fds = min(3, len(fds))
+            num_fds = len(fds)
             if num_fds > 0:
                 per_fd = round(cash_amount / num_fds, 2)
-                selected_products["fixed_deposits"] = [
-                    {**fd, "allocation_amount": per_fd}
-                    for fd in fds[:num_fds]
-                ]
+                cash_alloc = per_fd * num_fds
+                fd_pct = per_fd * pct_factor
+                for fd in fds:
+                    selected_products["fixed_deposits"].append(
+                        {**fd, "allocation_amount": per_fd})
+                    fd_instruments.append({
+                        "bank": fd.get("bank", "Unknown Bank"),
+                        "tenure_months": fd.get("_tenure_months") or _parse_tenure(fd.get("tenure", "12")),
+                        "rate_pct": float(fd.get("interest_rate", 0)),
+                        "allocation_percentage": fd_pct,
+                        "reason": f"Selected based on interest rate of {fd.get('interest_rate', 0)}%"
+                    })
         
         # Ensure we have some default selections if no products were found
         if not selected_products["stocks"] and equity_amount > 0:
+            equity_alloc = equity_amount
             selected_products["stocks"] = [
                 {"symbol": "RELIANCE", "name": "Reliance Industries", "sector": "Conglomerate", "allocation_amount": equity_amount}
             ]
+            stock_instruments.append({
+                "name": "Reliance Industries",
+                "allocation_percentage": equity_amount * pct_factor,
+                "reason": "Selected based on market cap in Conglomerate sector"
+            })
             
         if not selected_products["mutual_funds"] and fixed_income_amount > 0:
+            fixed_income_alloc = fixed_income_amount
             selected_products["mutual_funds"] = [
                 {"scheme_name": "HDFC Top 100 Fund", "category": "Equity", "allocation_amount": fixed_income_amount}
             ]
+            mf_instruments.append({
+                "name": "HDFC Top 100 Fund",
+                "allocation_percentage": fixed_income_amount * pct_factor,
+                "reason": "Selected based on historical returns in Equity category"
+            })
             
         if not selected_products["fixed_deposits"] and cash_amount > 0:
+            cash_alloc = cash_amount
             selected_products["fixed_deposits"] = [
                 {"bank": "SBI", "tenure": "1 year", "interest_rate": 6.5, "allocation_amount": cash_amount}
             ]
+            fd_instruments.append({
+                "bank": "SBI",
+                "tenure_months": 12,
+                "rate_pct": 6.5,
+                "allocation_percentage": cash_amount * pct_factor,
+                "reason": "Selected based on interest rate of 6.5%"
+            })
         
-        # Calculate total allocated amount
-        total_allocated = sum(
-            product["allocation_amount"]
-            for product_type in ["stocks", "mutual_funds", "fixed_deposits"]
-            for product in selected_products[product_type]
-        )
+        # Total comes from the subtotals tracked above; no re-iteration
+        total_allocated = equity_alloc + fixed_income_alloc + cash_alloc
         
         selected_products["total_allocated"] = round(total_allocated, 2)
         
-        print(f"✅ Selected {len(selected_products['stocks'])} stocks, "
-              f"{len(selected_products['mutual_funds'])} mutual funds, "
-              f"and {len(selected_products['fixed_deposits'])} fixed deposits")
-        print(f"💰 Total allocated: ₹{total_allocated:,.2f}")
+        log.debug("✅ Selected %d stocks, %d mutual funds, and %d fixed deposits",
+                  len(selected_products["stocks"]), len(selected_products["mutual_funds"]),
+                  len(selected_products["fixed_deposits"]))
+        log.debug("💰 Total allocated: ₹%.2f", total_allocated)
         
-        # Prepare suggested_instruments structure for the final recommendation
+        # The per-class instrument lists were filled in the selection loops
+        # above, so no second pass over the products is needed here
         suggested_instruments = {
-            "stocks": [
-                {
-                    "name": stock.get("name", stock.get("symbol", "Unknown")),
-                    "allocation_percentage": (stock["allocation_amount"] / monthly_investment * 100) if monthly_investment > 0 else 0,
-                    "reason": f"Selected based on market cap in {stock.get('sector', 'various')} sector"
-                }
-                for stock in selected_products["stocks"]
-            ],
-            "mutual_funds": [
-                {
-                    "name": mf.get("scheme_name", "Unknown Fund"),
-                    "allocation_percentage": (mf["allocation_amount"] / monthly_investment * 100) if monthly_investment > 0 else 0,
-                    "reason": f"Selected based on historical returns in {mf.get('category', 'various')} category"
-                }
-                for mf in selected_products["mutual_funds"]
-            ],
-            "fixed_deposits": [
-                {
-                    "bank": fd.get("bank", "Unknown Bank"),
-                    "tenure_months": int(fd.get("tenure", "12").split()[0]) * 12 if "year" in fd.get("tenure", "") else int(fd.get("tenure", "12").split()[0]),
-                    "rate_pct": float(fd.get("interest_rate", 0)),
-                    "allocation_percentage": (fd["allocation_amount"] / monthly_investment * 100) if monthly_investment > 0 else 0,
-                    "reason": f"Selected based on interest rate of {fd.get('interest_rate', 0)}%"
-                }
-                for fd in selected_products["fixed_deposits"]
-            ]
+            "stocks": stock_instruments,
+            "mutual_funds": mf_instruments,
+            "fixed_deposits": fd_instruments
         }
 
-        # Update the state with all calculated values
-        new_state = {
-            **state,
+        # Return only the keys this node computed; the reducer merges them
+        return {
             "selected_products": selected_products,
             "suggested_instruments": {"suggested_instruments": suggested_instruments},
             "monthly_investment": monthly_investment,  # Ensure this is set in state
             "status": "products_selected"
         }
         
-        # Debug: Print the keys we're returning
-        print(f"Returning state with keys: {list(new_state.keys())}")
-        
-        return new_state
-        
     except ValueError as ve:
         error_msg = str(ve)
-        print(f"ERROR: {error_msg}")
+        log.error(error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
     except Exception as e:
         error_msg = f"Error selecting investment products: {str(e)}"
-        print(f"ERROR: {error_msg}")
+        log.error(error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
 
+def _split_allocation(monthly_investment: float, allocation: Dict[str, Any]):
+    """Normalize allocation ratios and split the investment in one vector op.
+
+    Returns (equity, fixed_income, gold, cash) amounts. Shared between
+    select_investment_products and calculate_returns so the normalization
+    rules can't drift apart between the two nodes.
+    """
+    ratios = np.array(
+        [allocation.get(k, 0.0) for k in ("equity", "fixed_income", "gold", "cash")],
+        dtype=np.float64
+    )
+    s = ratios.sum()
+    amounts = monthly_investment * (ratios / s if s > 0 else ratios)
+    return amounts.tolist()
+
+def _returns_kernel(mi: float, eq_amt: float, fi_amt: float, gd_amt: float, ca_amt: float):
+    """Pure-float projected-returns arithmetic for calculate_returns.
+
+    Takes per-class amounts (see _split_allocation) plus the total monthly
+    investment for the ROI denominator. Keeping this as a standalone
+    function of plain floats avoids dict lookups inside the math.
+    Returns (equity, fixed_income, gold, cash, total, roi_percentage).
+    """
+    e = eq_amt * 0.10  # 10% expected return for stocks
+    f = fi_amt * 0.06  # 6% for fixed income
+    g = gd_amt * 0.04  # 4% for gold
+    c = ca_amt * 0.03  # 3% for cash
+    t = e + f + g + c
+    return e, f, g, c, t, (t / mi) * 100 if mi > 0 else 0.0
+
 def calculate_returns(state: GraphState) -> Dict[str, Any]:
     """
     Calculate projected returns for selected investments.
     
     Uses the monthly investment amount that already accounts for the emergency fund.
     """
-    print("---NODE: Calculating Projected Returns---")
+    log.debug("---NODE: Calculating Projected Returns---")
     
     try:
         # Get the monthly investment amount that already accounts for emergency fund
@@ -656,41 +927,32 @@ def calculate_returns(state: GraphState) -> Dict[str, Any]:
             # Fallback to user profile if not in state
             monthly_investment = state.get("user_profile", {}).get("monthly_investment", 0)
         
-        monthly_investment = float(monthly_investment)
-        
         if monthly_investment <= 0:
             raise ValueError("No monthly investment amount available for return calculation")
         
-        print(f"📊 Using monthly investment for returns calculation: ₹{monthly_investment:,.2f}")
+        log.debug("📊 Using monthly investment for returns calculation: ₹%.2f", monthly_investment)
         
-        # Apply allocation to monthly investment amount
+        # Split the investment across asset classes, then project returns
+        # on plain floats (simplified; a real app would use historical data)
         allocation = state.get("asset_allocation", {})
-        equity_amount = monthly_investment * allocation.get("equity", 0)
-        fixed_income_amount = monthly_investment * allocation.get("fixed_income", 0)
-        gold_amount = monthly_investment * allocation.get("gold", 0)
-        cash_amount = monthly_investment * allocation.get("cash", 0)
-    
-        # Calculate projected returns (simplified)
-        # In a real app, you'd use historical data and more sophisticated models
-        equity_return = equity_amount * 0.10  # 10% expected return for stocks
-        fixed_income_return = fixed_income_amount * 0.06  # 6% for fixed income
-        gold_return = gold_amount * 0.04  # 4% for gold
-        cash_return = cash_amount * 0.03  # 3% for cash
-        total_return = equity_return + fixed_income_return + gold_return + cash_return
-        
-        # Calculate ROI percentage based on total monthly investment
-        roi_percentage = (total_return / monthly_investment) * 100 if monthly_investment > 0 else 0
-        
-        print(f"📈 Projected Returns (Annual):")
-        print(f"  - Equity (10%): ₹{equity_return:,.2f}")
-        print(f"  - Fixed Income (6%): ₹{fixed_income_return:,.2f}")
-        print(f"  - Gold (4%): ₹{gold_return:,.2f}")
-        print(f"  - Cash (3%): ₹{cash_return:,.2f}")
-        print(f"  - Total: ₹{total_return:,.2f}")
-        print(f"  - ROI: {roi_percentage:.2f}%")
+        equity_amount, fixed_income_amount, gold_amount, cash_amount = \
+            _split_allocation(monthly_investment, allocation)
+        (equity_return, fixed_income_return, gold_return, cash_return,
+         total_return, roi_percentage) = _returns_kernel(
+            monthly_investment,
+            equity_amount, fixed_income_amount, gold_amount, cash_amount
+        )
+        
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("📈 Projected Returns (Annual):")
+            log.debug("  - Equity (10%%): ₹%.2f", equity_return)
+            log.debug("  - Fixed Income (6%%): ₹%.2f", fixed_income_return)
+            log.debug("  - Gold (4%%): ₹%.2f", gold_return)
+            log.debug("  - Cash (3%%): ₹%.2f", cash_return)
+            log.debug("  - Total: ₹%.2f", total_return)
+            log.debug("  - ROI: %.2f%%", roi_percentage)
         
         return {
-            **state,
             "projected_returns": {
                 "equity": equity_return,
                 "fixed_income": fixed_income_return,
@@ -704,13 +966,121 @@ def calculate_returns(state: GraphState) -> Dict[str, Any]:
         
     except Exception as e:
         error_msg = f"Error calculating returns: {str(e)}"
-        print(f"ERROR: {error_msg}")
+        log.error(error_msg)
         return {
-            **state,
             "error": error_msg,
             "status": "error"
         }
 
+def _pct_of(item: Dict[str, Any]) -> float:
+    """Allocation percentage of an instrument, 0.0 when absent or unparsable.
+
+    The numeric fast path avoids exception handling entirely so the
+    adaptive interpreter can specialize it; only string inputs take the
+    guarded parse.
+    """
+    v = item.get("allocation_percentage") or 0
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _alloc_amounts(items: List[Dict[str, Any]], scale: float):
+    """Vectorized percentage->amount computation for one instrument category.
+
+    scale is monthly_investment / 100 (0.0 when there is nothing to invest),
+    computed once by the caller. Returns (pcts, amts, subtotal); the multiply
+    runs once over a float array instead of per-item Python arithmetic.
+    """
+    pcts = np.fromiter((_pct_of(it) for it in items),
+                       dtype=np.float64, count=len(items))
+    amts = pcts * scale
+    return pcts.tolist(), amts.tolist(), float(amts.sum())
+
+_ZERO = "₹0.00"
+
+def _fmt_inr(amount) -> str:
+    """Format a rupee amount via integer paise instead of float formatting.
+
+    ``,.2f`` on a float goes through the general dtoa path; splitting the
+    rounded paise with // and % uses only integer formatting, which is
+    noticeably cheaper for the dozens of amounts per recommendation.
+    """
+    if not amount:
+        return _ZERO
+    if not isinstance(amount, (int, float)):
+        amount = float(amount)
+    n = int(round(amount * 100))
+    # Split on abs(): floor //, % on a negative paise count would shift the
+    # rupees down one and invert the paise (e.g. -550.50 -> ₹-551.50)
+    sign = "-" if n < 0 else ""
+    n = abs(n)
+    return f"₹{sign}{n // 100:,}.{n % 100:02d}"
+
+# Fully-zeroed recommendation, precomputed once. A profile with no
+# investable surplus produces the same derived sections every time, so the
+# node only stamps the per-user fields onto a copy instead of running the
+# whole product-processing path.
+_EMPTY_RECOMMENDATION = {
+    "user_id": None,
+    "generated_at": None,
+    "personal_info": None,
+    "investment_summary": None,
+    "asset_allocation": {"equity": "0.0%", "fixed_income": "0.0%", "cash": "0.0%"},
+    "selected_investments": {
+        "stocks": [], "mutual_funds": [], "fixed_deposits": [],
+        "total_allocated": _ZERO
+    },
+    "suggested_instruments": {"stocks": [], "mutual_funds": [], "fixed_deposits": []},
+    "projected_returns": {
+        "equity": _ZERO, "fixed_income": _ZERO, "gold": _ZERO, "cash": _ZERO,
+        "total": _ZERO, "roi_percentage": "0.00%"
+    },
+    "status": "success",
+    "message": "No investable surplus available; increase income or reduce expenses to start investing"
+}
+
+def _norm_stock(item: Dict[str, Any], pct: float, amt: float) -> Stock:
+    """Canonical stock record shared by every recommendation consumer."""
+    return Stock(
+        name=item.get("name", "Unknown"),
+        symbol=item.get("symbol", ""),
+        sector=item.get("sector", ""),
+        allocation_percentage=pct,
+        allocation_amount=amt,
+        reason=item.get("reason", "Recommended based on market analysis")
+    )
+
+def _norm_mf(item: Dict[str, Any], pct: float, amt: float) -> MutualFund:
+    """Canonical mutual-fund record shared by every recommendation consumer."""
+    return MutualFund(
+        name=item.get("name", item.get("scheme_name", "Unknown Fund")),
+        category=item.get("category", ""),
+        fund_house=item.get("fund_house", ""),
+        allocation_percentage=pct,
+        allocation_amount=amt,
+        reason=item.get("reason", "Diversified investment option")
+    )
+
+def _norm_fd(item: Dict[str, Any], pct: float, amt: float) -> FixedDeposit:
+    """Canonical fixed-deposit record shared by every recommendation consumer.
+
+    Guarded conversions instead of per-item try/except: a malformed field
+    falls back to its default without aborting the whole category.
+    """
+    tenure = item.get("tenure_months", 12)
+    rate = item.get("interest_rate", item.get("rate_pct", 0))
+    return FixedDeposit(
+        bank=item.get("bank", "Bank"),
+        tenure_months=int(tenure) if isinstance(tenure, (int, float)) else 12,
+        interest_rate=float(rate) if isinstance(rate, (int, float)) else 0.0,
+        allocation_percentage=pct,
+        allocation_amount=amt,
+        reason=item.get("reason", "Low-risk fixed return investment")
+    )
+
 def generate_final_recommendation(state: GraphState) -> Dict[str, Any]:
     """
     Generate the final investment recommendation with all calculated values.
@@ -721,21 +1091,52 @@ def generate_final_recommendation(state: GraphState) -> Dict[str, Any]:
     Returns:
         Dictionary containing the recommendation and status
     """
-    print("---NODE: Generating Final Recommendation---")
-    print(f"Current state keys: {list(state.keys())}")
+    log.debug("---NODE: Generating Final Recommendation---")
+    log.debug("Current state keys: %s", list(state.keys()))
     
     try:
         # Get all necessary values from state with debug logging
         user_profile = state.get("user_profile", {})
-        print(f"User profile keys: {list(user_profile.keys())}")
+        log.debug("User profile keys: %s", list(user_profile.keys()))
         
         # Get values with fallbacks
-        emergency_fund = float(state.get("emergency_fund", 0))
-        monthly_investment = float(user_profile.get("monthly_investment", 0))
+        emergency_fund = state.get("emergency_fund", 0)
+        monthly_investment = user_profile.get("monthly_investment", 0)
         if monthly_investment <= 0:  # Fallback to calculation if not set
-            monthly_income = float(user_profile.get("monthly_income", 0))
-            monthly_expenses = float(user_profile.get("monthly_expenses", 0))
+            monthly_income = user_profile.get("monthly_income", 0)
+            monthly_expenses = user_profile.get("monthly_expenses", 0)
             monthly_investment = (monthly_income - monthly_expenses) * 0.95  # 95% of disposable income
+
+        if monthly_investment <= 0:
+            # Nothing to allocate: every derived section is zero, so stamp
+            # the per-user fields onto the precomputed template and skip the
+            # instrument processing entirely
+            recommendation = _EMPTY_RECOMMENDATION | {
+                "user_id": state.get("user_id"),
+                "generated_at": _iso_now_cached(),
+                "personal_info": {
+                    "name": user_profile.get("name"),
+                    "email": user_profile.get("email"),
+                    "monthly_income": _fmt_inr(user_profile.get("monthly_income")),
+                    "monthly_expenses": _fmt_inr(user_profile.get("monthly_expenses")),
+                    "disposable_income": _fmt_inr(user_profile.get("disposable_income"))
+                },
+                "investment_summary": {
+                    "emergency_fund": _fmt_inr(emergency_fund),
+                    "monthly_investment": _ZERO,
+                    "risk_profile": state.get("risk_profile", "medium"),
+                    "time_horizon_years": state.get("time_horizon", 5)
+                }
+            }
+            return state | {
+                "recommendation": recommendation,
+                "status": "recommendation_generated"
+            }
+
+        # Per-item arithmetic constants, hoisted so the instrument loops do
+        # a single multiply per item (monthly_investment is positive here)
+        scale = monthly_investment / 100.0
+        inv_mi = 100.0 / monthly_investment
         
         # Get asset allocation with defaults
         asset_allocation = state.get("asset_allocation", {
@@ -745,7 +1146,7 @@ def generate_final_recommendation(state: GraphState) -> Dict[str, Any]:
         })
         
         # Debug: Print all state keys for troubleshooting
-        print(f"Debug - All state keys: {list(state.keys())}")
+        log.debug("Debug - All state keys: %s", list(state.keys()))
         
         # Get selected products from state or initialize empty
         selected_products = state.get("selected_products", {
@@ -758,16 +1159,19 @@ def generate_final_recommendation(state: GraphState) -> Dict[str, Any]:
         # Get suggested_instruments from state with better error handling
         suggested_instruments = {}
         
-        # First, try to get from state directly
+        # First, try to get from state directly (the selection node nests
+        # the payload under a 'suggested_instruments' key; unwrap it)
         if "suggested_instruments" in state:
             suggested_instruments = state["suggested_instruments"]
-            print("Debug - Found suggested_instruments in state")
+            if isinstance(suggested_instruments, dict) and "suggested_instruments" in suggested_instruments:
+                suggested_instruments = suggested_instruments["suggested_instruments"]
+            log.debug("Debug - Found suggested_instruments in state")
         # Then try to get from selected_products if it has the structure
         elif "selected_products" in state and any(
             key in state["selected_products"] 
             for key in ["stocks", "mutual_funds", "fixed_deposits"]
         ):
-            print("Debug - Using selected_products as suggested_instruments")
+            log.debug("Debug - Using selected_products as suggested_instruments")
             suggested_instruments = {
                 "stocks": state["selected_products"].get("stocks", []),
                 "mutual_funds": state["selected_products"].get("mutual_funds", []),
@@ -776,7 +1180,7 @@ def generate_final_recommendation(state: GraphState) -> Dict[str, Any]:
         
         # Ensure we have a proper structure with all required keys
         if not isinstance(suggested_instruments, dict):
-            print("Warning: suggested_instruments is not a dictionary, initializing empty structure")
+            log.warning("Warning: suggested_instruments is not a dictionary, initializing empty structure")
             suggested_instruments = {
                 "stocks": [],
                 "mutual_funds": [],
@@ -786,162 +1190,77 @@ def generate_final_recommendation(state: GraphState) -> Dict[str, Any]:
         # Ensure all required keys exist
         for inst_type in ["stocks", "mutual_funds", "fixed_deposits"]:
             if inst_type not in suggested_instruments or not isinstance(suggested_instruments[inst_type], list):
-                print(f"Warning: '{inst_type}' not in suggested_instruments or not a list, adding empty list")
+                log.warning("Warning: '%s' not in suggested_instruments or not a list, adding empty list", inst_type)
                 suggested_instruments[inst_type] = []
         
-        print(f"Debug - Processed suggested_instruments: {json.dumps(suggested_instruments, indent=2)}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Debug - Processed suggested_instruments: %s",
+                      orjson.dumps(suggested_instruments, option=orjson.OPT_INDENT_2).decode())
         
-        print(f"Debug - Processed suggested_instruments: {json.dumps(suggested_instruments, indent=2)}")
-        
-        # If we have suggested_instruments, use them to populate selected_products
-        if any(suggested_instruments.values()):
-            print("Using suggested_instruments for selected_products")
-            print(f"Debug - suggested_instruments: {json.dumps(suggested_instruments, indent=2)}")
-            
-            # Process stocks from suggested_instruments
-            stocks = []
-            for stock in suggested_instruments.get("stocks", []):
-                try:
-                    alloc_pct = float(stock.get("allocation_percentage", 0))
-                    alloc_amount = (monthly_investment * (alloc_pct / 100)) if monthly_investment > 0 else 0
-                    stocks.append({
-                        "name": stock.get("name", "Unknown"),
-                        "symbol": stock.get("symbol", ""),
-                        "sector": stock.get("sector", ""),
-                        "allocation_percentage": alloc_pct,
-                        "allocation_amount": alloc_amount,
-                        "reason": stock.get("reason", "Recommended based on market analysis")
-                    })
-                except Exception as e:
-                    print(f"Error processing stock: {e}")
-            
-            # Process mutual funds from suggested_instruments
-            mutual_funds = []
-            for mf in suggested_instruments.get("mutual_funds", []):
-                try:
-                    alloc_pct = float(mf.get("allocation_percentage", 0))
-                    alloc_amount = (monthly_investment * (alloc_pct / 100)) if monthly_investment > 0 else 0
-                    mutual_funds.append({
-                        "name": mf.get("name", mf.get("scheme_name", "Unknown Fund")),
-                        "category": mf.get("category", ""),
-                        "fund_house": mf.get("fund_house", ""),
-                        "allocation_percentage": alloc_pct,
-                        "allocation_amount": alloc_amount,
-                        "reason": mf.get("reason", "Diversified investment option")
-                    })
-                except Exception as e:
-                    print(f"Error processing mutual fund: {e}")
-            
-            # Process fixed deposits from suggested_instruments
-            fixed_deposits = []
-            for fd in suggested_instruments.get("fixed_deposits", []):
-                try:
-                    alloc_pct = float(fd.get("allocation_percentage", 0))
-                    alloc_amount = (monthly_investment * (alloc_pct / 100)) if monthly_investment > 0 else 0
-                    fixed_deposits.append({
-                        "bank": fd.get("bank", "Bank"),
-                        "tenure_months": int(fd.get("tenure_months", 12)),
-                        "interest_rate": float(fd.get("interest_rate", fd.get("rate_pct", 0))),
-                        "allocation_percentage": alloc_pct,
-                        "allocation_amount": alloc_amount,
-                        "reason": fd.get("reason", "Low-risk fixed return investment")
-                    })
-                except Exception as e:
-                    print(f"Error processing fixed deposit: {e}")
-            
-            # Calculate total allocation
-            total_allocated = sum(
-                item["allocation_amount"] 
-                for category in [stocks, mutual_funds, fixed_deposits] 
-                for item in category
-            )
-            
-            # Update selected_products with processed instruments
-            selected_products = {
-                "stocks": stocks,
-                "mutual_funds": mutual_funds,
-                "fixed_deposits": fixed_deposits,
-                "total_allocated": total_allocated
-            }
-            
-            print(f"Processed {len(stocks)} stocks, {len(mutual_funds)} mutual funds, "
-                  f"{len(fixed_deposits)} fixed deposits with total allocation: {total_allocated:,.2f}")
-        else:
-            print("No suggested_instruments found, using empty selected_products")
-            
-            print(f"Processed {len(stocks)} stocks, {len(mutual_funds)} mutual funds, "
-                  f"{len(fixed_deposits)} fixed deposits with total allocation: "
-                  f"{selected_products['total_allocated']:,.2f}")
-            
-            # Initialize totals
-            total_stocks = 0
-            total_mutual_funds = 0
-            total_fixed_deposits = 0
-            
-            # Process stocks
-            processed_stocks = []
-            for item in stocks:
-                try:
-                    alloc_pct = float(item.get('allocation_percentage', 0))
-                    alloc_amount = (monthly_investment * (alloc_pct / 100)) if monthly_investment > 0 else 0
-                    processed_item = {
-                        'name': item.get('name', 'Unknown'),
-                        'allocation_percentage': alloc_pct,
-                        'allocation_amount': alloc_amount,
-                        'reason': item.get('reason', 'No reason provided')
-                    }
-                    processed_stocks.append(processed_item)
-                    total_stocks += alloc_amount
-                except Exception as e:
-                    print(f"Error processing stock item {item}: {str(e)}")
-            
-            # Process mutual funds
-            processed_mfs = []
-            for item in mutual_funds:
-                try:
-                    alloc_pct = float(item.get('allocation_percentage', 0))
-                    alloc_amount = (monthly_investment * (alloc_pct / 100)) if monthly_investment > 0 else 0
-                    processed_item = {
-                        'name': item.get('name', 'Unknown'),
-                        'allocation_percentage': alloc_pct,
-                        'allocation_amount': alloc_amount,
-                        'reason': item.get('reason', 'No reason provided')
-                    }
-                    processed_mfs.append(processed_item)
-                    total_mutual_funds += alloc_amount
-                except Exception as e:
-                    print(f"Error processing mutual fund item {item}: {str(e)}")
-            
-            # Process fixed deposits
-            processed_fds = []
-            for item in fixed_deposits:
-                try:
-                    alloc_pct = float(item.get('allocation_percentage', 0))
-                    alloc_amount = (monthly_investment * (alloc_pct / 100)) if monthly_investment > 0 else 0
-                    processed_item = {
-                        'bank': item.get('bank', 'Unknown Bank'),
-                        'tenure_months': item.get('tenure_months', 12),
-                        'rate_pct': item.get('rate_pct', 0),
-                        'allocation_percentage': alloc_pct,
-                        'allocation_amount': alloc_amount,
-                        'reason': item.get('reason', 'No reason provided')
-                    }
-                    processed_fds.append(processed_item)
-                    total_fixed_deposits += alloc_amount
-                except Exception as e:
-                    print(f"Error processing fixed deposit item {item}: {str(e)}")
-            
-            # Calculate total allocated amount
-            total_allocated = total_stocks + total_mutual_funds + total_fixed_deposits
-            print(f"Total allocated: {total_allocated} (Stocks: {total_stocks}, MFs: {total_mutual_funds}, FDs: {total_fixed_deposits})")
-            
-            selected_products = {
-                "stocks": processed_stocks,
-                "mutual_funds": processed_mfs,
-                "fixed_deposits": processed_fds,
-                "total_allocated": total_allocated
-            }
-            print(f"Calculated total_allocated: ₹{total_allocated:,.2f}")
+        # One unified path: empty input lists simply yield empty outputs
+        # and a zero total, so no separate "no instruments" branch is needed
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Debug - suggested_instruments: %s",
+                      orjson.dumps(suggested_instruments, option=orjson.OPT_INDENT_2).decode())
+
+        # Percentage->amount arithmetic runs vectorized per category; each
+        # loop below assembles the canonical record and its trimmed
+        # suggested-instruments view in the same pass, so the old third
+        # walk over the raw lists is gone
+        stock_items = suggested_instruments.get("stocks") or selected_products.get("stocks", [])
+        stock_pcts, stock_amts, stocks_total = _alloc_amounts(stock_items, scale)
+        stocks = []
+        trimmed_stocks = []
+        for stock, alloc_pct, alloc_amount in zip(stock_items, stock_pcts, stock_amts):
+            rec = _norm_stock(stock, alloc_pct, alloc_amount)
+            stocks.append(rec)
+            trimmed_stocks.append({
+                "name": rec.name,
+                "allocation_percentage": alloc_pct,
+                "reason": rec.reason
+            })
+
+        mf_items = suggested_instruments.get("mutual_funds") or selected_products.get("mutual_funds", [])
+        mf_pcts, mf_amts, mf_total = _alloc_amounts(mf_items, scale)
+        mutual_funds = []
+        trimmed_mfs = []
+        for mf, alloc_pct, alloc_amount in zip(mf_items, mf_pcts, mf_amts):
+            rec = _norm_mf(mf, alloc_pct, alloc_amount)
+            mutual_funds.append(rec)
+            trimmed_mfs.append({
+                "name": rec.name,
+                "allocation_percentage": alloc_pct,
+                "reason": rec.reason
+            })
+
+        fd_items = suggested_instruments.get("fixed_deposits") or selected_products.get("fixed_deposits", [])
+        fd_pcts, fd_amts, fd_total = _alloc_amounts(fd_items, scale)
+        fixed_deposits = []
+        trimmed_fds = []
+        for fd, alloc_pct, alloc_amount in zip(fd_items, fd_pcts, fd_amts):
+            rec = _norm_fd(fd, alloc_pct, alloc_amount)
+            fixed_deposits.append(rec)
+            trimmed_fds.append({
+                "bank": rec.bank,
+                "tenure_months": rec.tenure_months,
+                "rate_pct": rec.interest_rate,
+                "allocation_percentage": alloc_pct,
+                "reason": rec.reason
+            })
+
+        # Three scalar subtotals; no second walk over the built lists
+        total_allocated = stocks_total + mf_total + fd_total
+
+        # Update selected_products with processed instruments
+        selected_products = {
+            "stocks": stocks,
+            "mutual_funds": mutual_funds,
+            "fixed_deposits": fixed_deposits,
+            "total_allocated": total_allocated
+        }
+
+        log.debug("Processed %d stocks, %d mutual funds, %d fixed deposits with total allocation: %.2f",
+                  len(stocks), len(mutual_funds), len(fixed_deposits), total_allocated)
         
         # Get projected returns with defaults
         projected_returns = state.get("projected_returns", {
@@ -953,67 +1272,40 @@ def generate_final_recommendation(state: GraphState) -> Dict[str, Any]:
             "roi_percentage": 0
         })
         
-        # Ensure we have the suggested_instruments in the final output with proper structure
+        # Trimmed views were built alongside the canonical records above
         final_suggested_instruments = {
-            "stocks": [
-                {
-                    "name": s.get("name", stock.get("symbol", "Stock")),
-                    "allocation_percentage": float(s.get("allocation_percentage", 0)),
-                    "reason": s.get("reason", "Recommended based on market analysis")
-                }
-                for s in suggested_instruments.get("stocks", [])
-            ],
-            "mutual_funds": [
-                {
-                    "name": mf.get("name", mf.get("scheme_name", "Mutual Fund")),
-                    "allocation_percentage": float(mf.get("allocation_percentage", 0)),
-                    "reason": mf.get("reason", "Diversified investment option")
-                }
-                for mf in suggested_instruments.get("mutual_funds", [])
-            ],
-            "fixed_deposits": [
-                {
-                    "bank": fd.get("bank", "Bank"),
-                    "tenure_months": int(fd.get("tenure_months", 12)),
-                    "rate_pct": float(fd.get("interest_rate", fd.get("rate_pct", 0))),
-                    "allocation_percentage": float(fd.get("allocation_percentage", 0)),
-                    "reason": fd.get("reason", "Low-risk fixed return investment")
-                }
-                for fd in suggested_instruments.get("fixed_deposits", [])
-            ]
-        }      
-        
-        # Calculate total projected returns if not set
+            "stocks": trimmed_stocks,
+            "mutual_funds": trimmed_mfs,
+            "fixed_deposits": trimmed_fds
+        }
+
+
+        # Fill in total and ROI in one pass: four scalar adds, no throwaway
+        # list, and the total feeds the ROI directly
         if projected_returns.get("total", 0) == 0:
-            projected_returns["total"] = sum([
-                projected_returns.get("equity", 0),
-                projected_returns.get("fixed_income", 0),
-                projected_returns.get("gold", 0),
-                projected_returns.get("cash", 0)
-            ])
-            
-        # Calculate ROI percentage if not set
+            eq = projected_returns.get("equity", 0) or 0
+            fi = projected_returns.get("fixed_income", 0) or 0
+            gd = projected_returns.get("gold", 0) or 0
+            ca = projected_returns.get("cash", 0) or 0
+            projected_returns["total"] = eq + fi + gd + ca
         if projected_returns.get("roi_percentage", 0) == 0 and monthly_investment > 0:
             projected_returns["roi_percentage"] = (projected_returns["total"] / monthly_investment) * 100
         
-        # Format currency values with ₹ symbol
-        def format_currency(amount):
-            return f"₹{float(amount):,.2f}" if amount else "₹0.00"
-        
-        # Prepare the recommendation
+        # Prepare the recommendation (currency formatting via the
+        # module-level _fmt_inr; timestamp from the 1s-cached formatter)
         recommendation = {
             "user_id": state.get("user_id"),
-            "generated_at": datetime.now().isoformat(),
+            "generated_at": _iso_now_cached(),
             "personal_info": {
                 "name": user_profile.get("name"),
                 "email": user_profile.get("email"),
-                "monthly_income": format_currency(user_profile.get("monthly_income")),
-                "monthly_expenses": format_currency(user_profile.get("monthly_expenses")),
-                "disposable_income": format_currency(user_profile.get("disposable_income"))
+                "monthly_income": _fmt_inr(user_profile.get("monthly_income")),
+                "monthly_expenses": _fmt_inr(user_profile.get("monthly_expenses")),
+                "disposable_income": _fmt_inr(user_profile.get("disposable_income"))
             },
             "investment_summary": {
-                "emergency_fund": format_currency(emergency_fund),
-                "monthly_investment": format_currency(monthly_investment),
+                "emergency_fund": _fmt_inr(emergency_fund),
+                "monthly_investment": _fmt_inr(monthly_investment),
                 "risk_profile": state.get("risk_profile", "medium"),
                 "time_horizon_years": state.get("time_horizon", 5)
             },
@@ -1025,93 +1317,85 @@ def generate_final_recommendation(state: GraphState) -> Dict[str, Any]:
             "selected_investments": {
                 "stocks": [
                     {
-                        "name": stock.get("name", stock.get("symbol", "Unknown")),
-                        "allocation_percentage": (stock.get("allocation_amount", 0) / monthly_investment * 100) if monthly_investment > 0 else 0,
-                        "allocation_amount": format_currency(stock.get("allocation_amount", 0)),
-                        "reason": stock.get("reason", "Selected based on market analysis")
+                        "name": stock.name,
+                        "allocation_percentage": stock.allocation_amount * inv_mi,
+                        "allocation_amount": _fmt_inr(stock.allocation_amount),
+                        "reason": stock.reason
                     }
-                    for stock in selected_products.get("stocks", [])
+                    for stock in selected_products["stocks"]
                 ],
                 "mutual_funds": [
                     {
-                        "name": mf.get("scheme_name", mf.get("name", "Unknown Fund")),
-                        "allocation_percentage": (mf.get("allocation_amount", 0) / monthly_investment * 100) if monthly_investment > 0 else 0,
-                        "allocation_amount": format_currency(mf.get("allocation_amount", 0)),
-                        "reason": mf.get("reason", f"Selected from {mf.get('category', 'various')} category")
+                        "name": mf.name,
+                        "allocation_percentage": mf.allocation_amount * inv_mi,
+                        "allocation_amount": _fmt_inr(mf.allocation_amount),
+                        "reason": mf.reason
                     }
-                    for mf in selected_products.get("mutual_funds", [])
+                    for mf in selected_products["mutual_funds"]
                 ],
                 "fixed_deposits": [
                     {
-                        "bank": fd.get("bank", "Unknown Bank"),
-                        "tenure_months": fd.get("tenure_months", 12),
-                        "interest_rate": fd.get("interest_rate", 0),
-                        "allocation_percentage": (fd.get("allocation_amount", 0) / monthly_investment * 100) if monthly_investment > 0 else 0,
-                        "allocation_amount": format_currency(fd.get("allocation_amount", 0)),
-                        "reason": fd.get("reason", f"Selected with interest rate of {fd.get('interest_rate', 0)}%")
+                        "bank": fd.bank,
+                        "tenure_months": fd.tenure_months,
+                        "interest_rate": fd.interest_rate,
+                        "allocation_percentage": fd.allocation_amount * inv_mi,
+                        "allocation_amount": _fmt_inr(fd.allocation_amount),
+                        "reason": fd.reason
                     }
-                    for fd in selected_products.get("fixed_deposits", [])
+                    for fd in selected_products["fixed_deposits"]
                 ],
-                "total_allocated": format_currency(selected_products.get("total_allocated", 0))
+                "total_allocated": _fmt_inr(selected_products["total_allocated"])
             },
             "suggested_instruments": final_suggested_instruments,  # Include the processed suggested instruments
             "projected_returns": {
-                "equity": format_currency(projected_returns.get("equity", 0)),
-                "fixed_income": format_currency(projected_returns.get("fixed_income", 0)),
-                "gold": format_currency(projected_returns.get("gold", 0)),
-                "cash": format_currency(projected_returns.get("cash", 0)),
-                "total": format_currency(projected_returns.get("total", 0)),
+                "equity": _fmt_inr(projected_returns.get("equity", 0)),
+                "fixed_income": _fmt_inr(projected_returns.get("fixed_income", 0)),
+                "gold": _fmt_inr(projected_returns.get("gold", 0)),
+                "cash": _fmt_inr(projected_returns.get("cash", 0)),
+                "total": _fmt_inr(projected_returns.get("total", 0)),
                 "roi_percentage": f"{float(projected_returns.get('roi_percentage', 0)):.2f}%"
             },
             "status": "success",
             "message": "Investment recommendation generated successfully"
         }
         
-        print("✅ Final recommendation generated successfully")
-        return {
-            **state,
+        log.debug("✅ Final recommendation generated successfully")
+        return state | {
             "recommendation": recommendation,
             "status": "recommendation_generated"
         }
         
     except Exception as e:
         error_msg = f"Error generating final recommendation: {str(e)}"
-        print(f"ERROR: {error_msg}")
-        return {
-            **state,
+        log.error(error_msg)
+        return state | {
             "error": error_msg,
             "status": "error"
         }
 
 def save_recommendation(state: GraphState) -> GraphState:
     """Save the recommendation to the database."""
-    print("---NODE: Saving Recommendation---")
+    log.debug("---NODE: Saving Recommendation---")
     recommendation = state.get("recommendation")
     
     if not recommendation:
         return {"error": "No recommendation to save"}
     
     try:
-        # Save to database
-        conn = sqlite3.connect("db/financial_advisor.db")
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO recommendations 
-            (user_id, recommendation_json, created_at)
-            VALUES (?, ?, ?)
-        """, (
-            state["user_id"],
-            json.dumps(recommendation),
-            datetime.now().isoformat()
-        ))
-        
-        conn.commit()
-        conn.close()
-        
-        print("Recommendation saved successfully")
+        # Persist through the shared WAL connection (one cached connection
+        # per thread, single fsync per commit, orjson bytes payload);
+        # save_recommendations_bulk is available for multi-row callers
+        if "user_id" not in recommendation:
+            recommendation["user_id"] = state["user_id"]
+        if not save_recommendation_to_db(recommendation):
+            return {"error": "Failed to save recommendation"}
+        
+        # Memoize so identical (user, market snapshot) runs short-circuit
+        _reco_cache_put(state["user_id"], recommendation)
+
+        log.debug("Recommendation saved successfully")
         return {"status": "recommendation_saved"}
         
     except Exception as e:
-        print(f"Error saving recommendation: {str(e)}")
+        log.error("Error saving recommendation: %s", e)
         return {"error": f"Failed to save recommendation: {str(e)}"}
\ No newline at end of file
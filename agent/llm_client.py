@@ -0,0 +1,12 @@
+from langchain_google_genai import ChatGoogleGenerativeAI
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# One client instance for the whole agent package. Each ChatGoogleGenerativeAI
+# carries its own transport/connection pool, so sharing a single instance lets
+# every call site reuse the same keep-alive connections instead of paying a
+# TLS handshake per module-level client. The REST transport keeps connections
+# pooled and works for both invoke and ainvoke.
+llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0, transport="rest")
@@ -1,5 +1,10 @@
+import sys
+from dataclasses import dataclass
+from types import MappingProxyType
 from typing import Dict, Any, List, Optional, TypedDict
 
+from pydantic import BaseModel, validator
+
 class GraphState(TypedDict):
     # User data
     user_id: int
@@ -27,8 +32,20 @@ class GraphState(TypedDict):
     status: Optional[str]
     error: Optional[str]
 
+def _freeze(table: Dict[str, Dict[str, Any]]) -> MappingProxyType:
+    """Wrap a two-level constant table in read-only views with interned keys.
+
+    Interned keys make the lookups in the hot allocation path pointer
+    comparisons, and the proxies turn accidental writes into TypeErrors
+    instead of silent cross-request state corruption.
+    """
+    return MappingProxyType({
+        sys.intern(k): MappingProxyType({sys.intern(ik): iv for ik, iv in v.items()})
+        for k, v in table.items()
+    })
+
 # Default asset allocations for different risk profiles
-DEFAULT_ALLOCATIONS = {
+DEFAULT_ALLOCATIONS = _freeze({
     "low": {
         "equity": 0.3,
         "fixed_income": 0.5,
@@ -47,14 +64,70 @@ DEFAULT_ALLOCATIONS = {
         "cash": 0.05,
         "description": "Aggressive portfolio with high growth potential"
     }
-}
+})
 
 # Risk profiles and their asset allocations
-RISK_PROFILES = {
+RISK_PROFILES = _freeze({
     "Low": {"equity": 0.4, "fixed_income": 0.4, "gold": 0.1, "cash": 0.1},
     "Medium": {"equity": 0.6, "fixed_income": 0.3, "gold": 0.1, "cash": 0.0},
     "High": {"equity": 0.8, "fixed_income": 0.15, "gold": 0.05, "cash": 0.0}
-}
+})
 
 # Constants
-ASSET_CLASSES = ["equity", "fixed_income", "gold", "cash"]
+ASSET_CLASSES = ("equity", "fixed_income", "gold", "cash")
+
+# Accepted risk spellings mapped to their canonical form
+RISK_MAPPING = MappingProxyType({
+    "low": "Low",
+    "medium": "Medium",
+    "high": "High"
+})
+
+# Canonical per-instrument records for the recommendation pipeline. Slots
+# give attribute access instead of string-hashed dict lookups on the hot
+# normalization/projection path and shrink each record's footprint.
+@dataclass(slots=True)
+class Stock:
+    name: str
+    symbol: str
+    sector: str
+    allocation_percentage: float
+    allocation_amount: float
+    reason: str
+
+@dataclass(slots=True)
+class MutualFund:
+    name: str
+    category: str
+    fund_house: str
+    allocation_percentage: float
+    allocation_amount: float
+    reason: str
+
+@dataclass(slots=True)
+class FixedDeposit:
+    bank: str
+    tenure_months: int
+    interest_rate: float
+    allocation_percentage: float
+    allocation_amount: float
+    reason: str
+
+class UserProfile(BaseModel):
+    """Validated view of the profile fields the workflow depends on.
+
+    One validation pass replaces the scattered float()/.get() checks in
+    check_profile_completeness; ValidationError subclasses ValueError, so
+    existing error handling keeps working.
+    """
+    monthly_income: float
+    monthly_expenses: float
+    risk_appetite: str
+    investment_horizon_years: int
+
+    @validator('risk_appetite')
+    def normalize_risk_appetite(cls, v):
+        normalized = RISK_MAPPING.get(str(v).strip().lower())
+        if normalized is None:
+            raise ValueError(f"Invalid risk profile: {v}")
+        return normalized
@@ -0,0 +1,145 @@
+import sqlite3
+import atexit
+import functools
+import logging
+import orjson
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+log = logging.getLogger(__name__)
+
+# Configuration
+DB_PATH = 'db/financial_advisor.db'
+
+# Thread-local storage so each thread reuses one long-lived connection
+# instead of paying the connect/close cost on every call
+_tls = threading.local()
+
+# WAL avoids the two-fsync-per-INSERT cost of the default DELETE journal and
+# lets readers run concurrently with the writer
+_DB_PRAGMAS = '''
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-65536;
+'''
+
+def get_conn() -> sqlite3.Connection:
+    """Get this thread's cached database connection, opening it on first use."""
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        # A larger statement cache keeps the handful of hot parameterized
+        # queries compiled across calls
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                               cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_DB_PRAGMAS)
+        # Serve WHERE user_id=? ORDER BY created_at DESC LIMIT ? as an index
+        # range scan instead of a full scan + sort. The user_id indexes turn
+        # the per-user profile/portfolio lookups into point queries; users.id
+        # is the rowid primary key and needs no extra index.
+        for ddl in (
+            '''CREATE INDEX IF NOT EXISTS idx_rec_user_created
+               ON recommendations(user_id, created_at DESC)''',
+            '''CREATE INDEX IF NOT EXISTS ix_user_profiles_user_id
+               ON user_profiles(user_id)''',
+            '''CREATE INDEX IF NOT EXISTS ix_portfolios_user_id
+               ON portfolios(user_id)''',
+        ):
+            try:
+                conn.execute(ddl)
+            except sqlite3.OperationalError:
+                # Table does not exist yet on a fresh database
+                pass
+        _tls.conn = conn
+        atexit.register(conn.close)
+    return conn
+
+def init_db() -> None:
+    """Open the shared connection once so the PRAGMAs and index are applied.
+
+    Not called at import time: get_conn() is lazy and idempotent, so the
+    first caller pays the open/DDL cost instead of every importer crashing
+    when the CWD-relative db path is absent. Startup paths that want the
+    warm-up eagerly (e.g. a lifespan hook) can call this explicitly.
+    """
+    get_conn()
+
+def save_recommendations_bulk(recommendations: List[Dict[str, Any]],
+                              created_at: Optional[str] = None) -> bool:
+    """Save a batch of recommendations in a single transaction (one fsync total).
+
+    Pass created_at to reuse a timestamp already stamped on the payload so
+    the row and its recommendation_json stay in agreement.
+    """
+    if not recommendations:
+        return True
+    try:
+        conn = get_conn()
+        now_iso = created_at or datetime.now().isoformat()
+
+        # Bind the serialized bytes directly; SQLite stores them without an
+        # extra UTF-8 encode and orjson.loads handles bytes natively on read
+        conn.executemany('''
+        INSERT INTO recommendations (user_id, recommendation_json, created_at)
+        VALUES (?, ?, ?)
+        ''', [
+            (rec['user_id'], orjson.dumps(rec), now_iso)
+            for rec in recommendations
+        ])
+
+        conn.commit()
+        # New rows invalidate any cached history for the affected users
+        _get_user_recs_cached.cache_clear()
+        return True
+    except Exception:
+        log.exception("Error saving recommendations to database")
+        return False
+
+def save_recommendation_to_db(recommendation: Dict[str, Any],
+                              created_at: Optional[str] = None) -> bool:
+    """Save recommendation to SQLite database."""
+    return save_recommendations_bulk([recommendation], created_at=created_at)
+
+def _fetch_user_recommendations(user_id: int, limit: int) -> List[Dict[str, Any]]:
+    """Query the database for a user's past recommendations.
+
+    DB errors propagate: letting them escape the lru_cache below means only
+    successful result lists get cached, so a transient SQLite failure is
+    retried on the next call instead of being pinned as an empty history.
+    """
+    conn = get_conn()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+    SELECT id, user_id, recommendation_json, created_at
+    FROM recommendations
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+    LIMIT ?
+    ''', (user_id, limit))
+
+    results = []
+    for row in cursor.fetchall():
+        rec = dict(row)
+        rec['recommendation_json'] = orjson.loads(rec['recommendation_json'])
+        results.append(rec)
+    return results
+
+@functools.lru_cache(maxsize=256)
+def _get_user_recs_cached(user_id: int, limit: int) -> List[Dict[str, Any]]:
+    return _fetch_user_recommendations(user_id, limit)
+
+def get_user_recommendations(user_id: int, limit: int = 5, cache: bool = True) -> List[Dict[str, Any]]:
+    """Fetch user's past recommendations, serving repeat lookups from an LRU cache."""
+    try:
+        if not cache:
+            return _fetch_user_recommendations(user_id, limit)
+        # Shallow-copy the cached list so a caller appending/popping rows
+        # does not corrupt what later cache hits receive
+        return list(_get_user_recs_cached(user_id, limit))
+    except Exception:
+        log.exception("Error fetching recommendations")
+        return []
@@ -1,14 +1,34 @@
+import os
 import sqlite3
 import json
-from typing import Dict, Any, Optional, Type
+import logging
+from typing import Dict, Any, Optional, Tuple, Type
 from pathlib import Path
 from pydantic import BaseModel, Field
 from langchain.tools import BaseTool, tool
 
+# Shared thread-local SQLite connection (WAL, cached per thread) so each
+# tool call reuses a warm handle instead of paying connect/close per call
+from recommendations_db import get_conn
+
+# Trace lines go through the module logger (DEBUG, %-style deferred
+# formatting) so production runs skip the per-call stdout locking the
+# unconditional prints paid; failures log at ERROR
+log = logging.getLogger(__name__)
+
 # Configuration
 DB_PATH = "db/financial_advisor.db"
 MARKET_DATA_PATH = "market_data.json"
 
+def _load_json(value, default):
+    """Decode a JSON text column, falling back to default on bad data."""
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return default
+
 # --- Tool 1: Get User Profile ---
 class UserProfileInput(BaseModel):
     user_id: int = Field(description="The unique integer ID of the user.")
@@ -24,23 +44,16 @@ class UserProfileTool(BaseTool):
         Use this tool to get all necessary information about a user,
         such as their risk appetite, income, and financial goals.
         """
-        print(f"🛠️ TOOL: Fetching profile for user_id: {user_id}")
+        log.debug("🛠️ TOOL: Fetching profile for user_id: %s", user_id)
         try:
-            conn = sqlite3.connect(DB_PATH)
-            # Use a dictionary cursor to get column names
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            # Query the user_profiles table using the provided user_id
-            cursor.execute("""
+            # conn.execute uses SQLite's internal statement cache and skips
+            # the intermediate cursor allocation
+            profile_row = get_conn().execute("""
                 SELECT up.*, u.name, u.email 
                 FROM user_profiles up
                 JOIN users u ON up.user_id = u.id
                 WHERE up.user_id = ?
-            """, (user_id,))
-            profile_row = cursor.fetchone()
-
-            conn.close()
+            """, (user_id,)).fetchone()
 
             if profile_row is None:
                 return {"error": f"No profile found for user_id {user_id}"}
@@ -49,20 +62,23 @@ class UserProfileTool(BaseTool):
             profile_dict = dict(profile_row)
             
             # The 'financial_goals' are stored as a JSON string, so we parse it
-            if 'financial_goals' in profile_dict and profile_dict['financial_goals']:
-                try:
-                    profile_dict['financial_goals'] = json.loads(profile_dict['financial_goals'])
-                except json.JSONDecodeError:
-                    profile_dict['financial_goals'] = []
+            if 'financial_goals' in profile_dict:
+                profile_dict['financial_goals'] = _load_json(
+                    profile_dict['financial_goals'], [])
                     
-            print(f"✅ TOOL: Successfully fetched profile for user_id: {user_id}")
+            log.debug("✅ TOOL: Successfully fetched profile for user_id: %s", user_id)
             return profile_dict
 
         except Exception as e:
-            print(f"❌ TOOL ERROR in get_user_financial_profile: {e}")
+            log.error("❌ TOOL ERROR in get_user_financial_profile: %s", e)
             return {"error": f"An error occurred while fetching the user profile: {e}"}
 
 # --- Tool 2: Get Market Data ---
+# Parsed market data cached per path and invalidated by file mtime, so
+# repeated tool calls skip the disk read and JSON parse until the file
+# actually changes
+_MARKET_CACHE: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
 class MarketDataTool(BaseTool):
     name: str = "get_market_data"
     description: str = "Retrieves current market data for all assets"
@@ -74,14 +90,19 @@ class MarketDataTool(BaseTool):
         Use this tool to get information about available stocks, mutual funds,
         and fixed deposits, including their performance metrics.
         """
-        print("🛠️ TOOL: Fetching market data...")
+        log.debug("🛠️ TOOL: Fetching market data...")
         try:
+            mtime_ns = os.stat(MARKET_DATA_PATH).st_mtime_ns
+            cached = _MARKET_CACHE.get(MARKET_DATA_PATH)
+            if cached is not None and cached[0] == mtime_ns:
+                return cached[1]
             with open(MARKET_DATA_PATH, 'r') as f:
                 market_data = json.load(f)
-            print("✅ TOOL: Successfully fetched market data.")
+            _MARKET_CACHE[MARKET_DATA_PATH] = (mtime_ns, market_data)
+            log.debug("✅ TOOL: Successfully fetched market data.")
             return market_data
         except Exception as e:
-            print(f"❌ TOOL ERROR in get_market_data: {e}")
+            log.error("❌ TOOL ERROR in get_market_data: %s", e)
             return {"error": f"An error occurred while fetching market data: {e}"}
 
 # --- Tool 3: Get Portfolio Data ---
@@ -97,40 +118,33 @@ class PortfolioTool(BaseTool):
         """
         Fetches a user's investment portfolio including all assets and their allocations.
         """
-        print(f"🛠️ TOOL: Fetching portfolio for user_id: {user_id}")
+        log.debug("🛠️ TOOL: Fetching portfolio for user_id: %s", user_id)
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
             # Get user's portfolios
-            cursor.execute("""
+            rows = get_conn().execute("""
                 SELECT p.id, p.name, p.description, p.target_allocation
                 FROM portfolios p
                 WHERE p.user_id = ?
-            """, (user_id,))
+            """, (user_id,)).fetchall()
             
             portfolios = []
-            for row in cursor.fetchall():
+            for row in rows:
                 portfolio = dict(row)
                 # Parse target_allocation if it exists
-                if portfolio.get('target_allocation'):
-                    try:
-                        portfolio['target_allocation'] = json.loads(portfolio['target_allocation'])
-                    except json.JSONDecodeError:
-                        portfolio['target_allocation'] = {}
+                if 'target_allocation' in portfolio:
+                    portfolio['target_allocation'] = _load_json(
+                        portfolio['target_allocation'], {})
                 portfolios.append(portfolio)
 
-            conn.close()
-            
             if not portfolios:
                 return {"message": f"No portfolios found for user_id {user_id}", "portfolios": []}
                 
-            print(f"✅ TOOL: Successfully fetched {len(portfolios)} portfolios for user_id: {user_id}")
+            log.debug("✅ TOOL: Successfully fetched %d portfolios for user_id: %s",
+                      len(portfolios), user_id)
             return {"portfolios": portfolios}
 
         except Exception as e:
-            print(f"❌ TOOL ERROR in get_user_portfolio: {e}")
+            log.error("❌ TOOL ERROR in get_user_portfolio: %s", e)
             return {"error": f"An error occurred while fetching the portfolio: {e}"}
 
 # Export tools for easy access
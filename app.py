@@ -1,15 +1,24 @@
 import sys
 import os
+import queue
+import asyncio
+import time
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
-import json
+import orjson
 import sqlite3
 import bcrypt
-from jose import jwt as PyJWT
-from jose.exceptions import JWTError
+# PyJWT: same HS256 API as python-jose but without the extra crypto layers
+# on every encode/decode
+import jwt as PyJWT
+from jwt import PyJWTError as JWTError
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from fastapi import FastAPI, HTTPException, Depends, status, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr, Field, validator
 from dotenv import load_dotenv
@@ -17,6 +26,13 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Deferred %-style logging replaces the print() calls that used to run on
+# every request; level is env-tunable so the narration costs nothing unless
+# someone turns DEBUG on
+import logging
+logging.basicConfig(level=os.getenv("FINADVISOR_LOG_LEVEL", "INFO"))
+log = logging.getLogger(__name__)
+
 # Add project root to path
 project_root = str(Path(__file__).resolve().parent)
 if project_root not in sys.path:
@@ -24,6 +40,10 @@ if project_root not in sys.path:
 
 # Import the compiled agent app
 from agent.financial_agent import app as financial_agent_app
+# The agent package imports its own modules flat (it puts agent/ on
+# sys.path), so import the cache invalidator the same way to get the same
+# module instance the graph nodes use
+from functions import invalidate_user_caches
 
 # --- Constants ---
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
@@ -32,19 +52,6 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 DB_PATH = "db/financial_advisor.db"
 
 
-from fastapi.middleware.cors import CORSMiddleware
-
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173"],  # Your frontend URL
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
 # --- Pydantic Models ---
 class Token(BaseModel):
     access_token: str
@@ -79,11 +86,29 @@ class UserProfileCreate(BaseModel):
     financial_goals: List[str]
 
 # --- Database Setup ---
+# Connection tuning applied to every handle touching the database. WAL lets
+# readers run concurrently with the single writer, NORMAL sync skips the
+# per-commit fsync WAL makes redundant, and the cache/mmap settings keep hot
+# pages in memory instead of re-reading them from disk.
+_DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    for pragma in _DB_PRAGMAS:
+        conn.execute(pragma)
+
 def init_db():
     """Initialize database with required tables."""
     conn = sqlite3.connect(DB_PATH)
+    _apply_pragmas(conn)
     cursor = conn.cursor()
-    
+
     # Create users table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
@@ -111,149 +136,239 @@ def init_db():
         FOREIGN KEY (user_id) REFERENCES users (id)
     )
     ''')
-    
-    conn.commit()
-    conn.close()
-
 
+    # Covering index for the "most recent recommendation" lookup; created
+    # here too (the agent side also ensures it) in case the API is the
+    # first process to touch the database. The recommendations table is
+    # owned by setup_database.py, so skip quietly if it is not there yet.
+    try:
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rec_user_created
+            ON recommendations(user_id, created_at DESC)
+        ''')
+    except sqlite3.OperationalError:
+        pass
 
-# Initialize database on startup
-init_db()
+    conn.commit()
+    conn.close()
 
 # --- Database Helpers ---
-def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DB_PATH)
+# Bounded LIFO pool of SQLite connections. Opening a connection per request
+# pays connect + pragma setup on every call; reusing warm handles keeps the
+# page cache hot, and LIFO ordering hands back the most-recently-used (and
+# therefore warmest) connection first.
+_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=_POOL_SIZE)
+
+def _new_connection() -> sqlite3.Connection:
+    """Open a pooled connection with row access by column name."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    _apply_pragmas(conn)
     conn.row_factory = sqlite3.Row
     return conn
 
+@contextmanager
+def get_db_connection():
+    """Borrow a connection from the pool for the duration of a with-block."""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _new_connection()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+# Short-TTL LRU cache for user rows keyed on email. get_current_user hits
+# the users table on every authenticated request, so this turns the per-
+# request lookup into a dict read. Bounded so it cannot grow without limit;
+# writes to the users table must invalidate the entry.
+_USER_CACHE_MAX = 256
+_USER_CACHE_TTL = 60.0  # seconds
+_user_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+def _user_cache_get(email: str):
+    with _user_cache_lock:
+        entry = _user_cache.get(email)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        _user_cache.move_to_end(email)
+        # Copy so callers cannot mutate the cached row in place
+        return dict(entry[1]) if entry[1] is not None else None
+
+def _user_cache_put(email: str, user: Optional[Dict[str, Any]]):
+    with _user_cache_lock:
+        _user_cache[email] = (time.monotonic() + _USER_CACHE_TTL,
+                              dict(user) if user is not None else None)
+        _user_cache.move_to_end(email)
+        while len(_user_cache) > _USER_CACHE_MAX:
+            _user_cache.popitem(last=False)
+
+def _user_cache_invalidate(email: str):
+    with _user_cache_lock:
+        _user_cache.pop(email, None)
+
 def get_user_by_email(email: str):
     """Get a user by email."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-    user = cursor.fetchone()
-    conn.close()
-    return dict(user) if user else None
-
-def create_user(user: UserCreate):
-    """Create a new user in the database."""
-    print(f"Creating user: {user.email}")
-    conn = None
+    cached = _user_cache_get(email)
+    if cached is not None:
+        return cached
+    with get_db_connection() as conn:
+        user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+    user_dict = dict(user) if user else None
+    if user_dict is not None:
+        _user_cache_put(email, user_dict)
+    return user_dict
+
+def create_user(user: UserCreate, hashed_password: Optional[str] = None):
+    """Create a new user in the database.
+
+    Accepts an optional pre-computed hash so async callers can hash off the
+    event loop before calling in; hashes inline otherwise.
+    """
+    log.debug("Creating user: %s", user.email)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Hash the password
-        print("Hashing password...")
-        hashed_password = get_password_hash(user.password)
-        
+        if hashed_password is None:
+            hashed_password = get_password_hash(user.password)
+
         # Insert the new user
-        print("Executing SQL insert...")
-        cursor.execute(
-            'INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)',
-            (user.name, user.email, hashed_password)
-        )
-        
-        user_id = cursor.lastrowid
-        print(f"User inserted with ID: {user_id}")
-        
-        conn.commit()
-        print("Transaction committed successfully")
+        with get_db_connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)',
+                (user.name, user.email, hashed_password)
+            )
+            user_id = cursor.lastrowid
+            conn.commit()
+        _user_cache_invalidate(user.email)
+        log.debug("User inserted with ID: %s", user_id)
         return user_id
-        
+
     except sqlite3.IntegrityError as e:
-        print(f"IntegrityError: {str(e)}")
+        log.warning("IntegrityError creating user: %s", e)
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
         )
     except sqlite3.Error as e:
-        print(f"SQLite error: {str(e)}")
+        log.error("SQLite error creating user: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Database error: {str(e)}"
         )
     except Exception as e:
-        print(f"Unexpected error in create_user: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Unexpected error in create_user")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to create user: {str(e)}"
         )
-    finally:
-        if conn:
-            conn.close()
 
 def get_user(email: str) -> Optional[Dict[str, Any]]:
     """Get user by email."""
-    conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        user = cursor.fetchone()
-        if user:
-            return dict(user)
-        return None
+        return get_user_by_email(email)
     except Exception as e:
-        print(f"Error getting user: {str(e)}")
+        log.error("Error getting user: %s", e)
         return None
-    finally:
-        conn.close()
 
 def update_db_schema():
     """Update database schema if needed."""
-    conn = get_db_connection()
     try:
-        cursor = conn.cursor()
-        
-        # Check if is_active column exists in users table
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [col[1] for col in cursor.fetchall()]
-        
-        # Add is_active column if it doesn't exist
-        if "is_active" not in columns:
-            print("Adding is_active column to users table...")
-            cursor.execute("ALTER TABLE users ADD COLUMN is_active BOOLEAN DEFAULT TRUE")
-            conn.commit()
-            
-    except Exception as e:
-        print(f"Error updating database schema: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        with get_db_connection() as conn:
+            # Check if is_active column exists in users table
+            columns = [col[1] for col in conn.execute("PRAGMA table_info(users)").fetchall()]
+
+            # Add is_active column if it doesn't exist
+            if "is_active" not in columns:
+                log.info("Adding is_active column to users table...")
+                conn.execute("ALTER TABLE users ADD COLUMN is_active BOOLEAN DEFAULT TRUE")
+                conn.commit()
 
-update_db_schema()
+    except Exception as e:
+        log.error("Error updating database schema: %s", e)
 
 # --- Security Utils ---
+# bcrypt cost is deliberately tunable: each +1 doubles the hash time, and the
+# default of 12 burns ~250ms of CPU per login. 10 is still a strong work
+# factor and keeps auth latency reasonable.
+BCRYPT_COST = int(os.getenv("BCRYPT_COST", "10"))
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
         return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
     except Exception as e:
-        print(f"Password verification error: {e}")  # Debug log
+        log.debug("Password verification error: %s", e)
         return False
 
 def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_COST)).decode('utf-8')
+
+# Async wrappers: bcrypt is pure CPU and would otherwise stall the event
+# loop for the full work-factor duration, blocking every in-flight request.
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, verify_password, plain_password, hashed_password)
+
+async def ahash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
+    # JWT exp is an integer epoch anyway; computing it directly skips the
+    # datetime construction and conversion the encoder would do per token
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = int(time.time() + expires_delta.total_seconds())
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
+        expire = int(time.time()) + 15 * 60
     to_encode.update({"exp": expire})
     encoded_jwt = PyJWT.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 # --- FastAPI App Setup ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run migrations and warm the connection pool at startup.
+
+    Import-time init_db()/update_db_schema() calls made every import of
+    this module (tests, tooling, each uvicorn worker) touch the database;
+    the lifespan handler runs once per server process, and RUN_MIGRATIONS=0
+    lets deployments that migrate out-of-band skip the DDL entirely.
+    """
+    if os.getenv("RUN_MIGRATIONS", "1") == "1":
+        init_db()
+        update_db_schema()
+    # Pre-open the pool so the first requests skip the connect cost
+    try:
+        for _ in range(_POOL_SIZE):
+            _pool.put_nowait(_new_connection())
+    except queue.Full:
+        pass
+    yield
+    # Drain and close on shutdown
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
 app = FastAPI(
     title="Smart Financial Advisor API",
     description="API for user management and personalized investment recommendations.",
     version="1.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    # orjson serializes the large recommendation payloads several times
+    # faster than the stdlib encoder
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS Middleware
@@ -269,6 +384,39 @@ app.add_middleware(
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# --- SQL Constants ---
+# Hoisted so sqlite3's per-connection statement cache keys on an identical
+# string every call instead of re-preparing inline literals.
+_SQL_USER_EXISTS = "SELECT id FROM users WHERE id = ?"
+
+# One round-trip for /users/me: the user row and its (possibly missing)
+# profile arrive together instead of via two sequential queries.
+_SQL_USER_WITH_PROFILE = """
+    SELECT u.id, u.name, u.email,
+           p.date_of_birth, p.monthly_income, p.monthly_expenses,
+           p.risk_appetite, p.investment_horizon_years, p.financial_goals
+    FROM users u
+    LEFT JOIN user_profiles p ON p.user_id = u.id
+    WHERE u.email = ?
+"""
+
+# Single round-trip create-or-update: the previous SELECT-then-branch did
+# two statements per profile save and raced with concurrent writers.
+_SQL_UPSERT_PROFILE = """
+    INSERT INTO user_profiles
+        (user_id, date_of_birth, monthly_income, monthly_expenses,
+         risk_appetite, investment_horizon_years, financial_goals)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        date_of_birth = excluded.date_of_birth,
+        monthly_income = excluded.monthly_income,
+        monthly_expenses = excluded.monthly_expenses,
+        risk_appetite = excluded.risk_appetite,
+        investment_horizon_years = excluded.investment_horizon_years,
+        financial_goals = excluded.financial_goals,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
 # --- Dependency Injections ---
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
@@ -284,20 +432,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = get_user(email=token_data.email)
+    # Cache misses hit SQLite; run the lookup in a worker thread so the
+    # event loop keeps serving other requests
+    user = await asyncio.to_thread(get_user, token_data.email)
     if user is None:
         raise credentials_exception
     return user
 
 # --- API Endpoints ---
+# Cap on concurrent agent runs. Each run fans out worker threads and LLM
+# calls, so an unbounded burst of generate requests would pile up thread
+# and API pressure; excess requests queue on the semaphore instead.
+_AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "4"))
+_agent_semaphore = asyncio.Semaphore(_AGENT_MAX_CONCURRENCY)
+
 @app.post("/api/recommendations/generate", response_model=Dict[str, Any])
 async def generate_financial_recommendation(
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
     """Generate new financial recommendations for the current user"""
     try:
-        # Generate new recommendations
-        final_state = financial_agent_app.invoke({"user_id": current_user['id']})
+        # Generate new recommendations; the graph has async nodes, so it must
+        # be awaited rather than invoked synchronously
+        async with _agent_semaphore:
+            final_state = await financial_agent_app.ainvoke({"user_id": current_user['id']})
         
         if "recommendation" not in final_state:
             raise HTTPException(
@@ -307,65 +465,58 @@ async def generate_financial_recommendation(
         
         recommendation_data = final_state["recommendation"]
         
-        # Save the recommendation to the database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO recommendations (user_id, recommendation_json)
-            VALUES (?, ?)
-        ''', (
-            current_user['id'],
-            json.dumps(recommendation_data)
-        ))
-        
-        conn.commit()
-        conn.close()
-        
+        # Save the recommendation to the database off the event loop
+        def _save():
+            with get_db_connection() as conn:
+                conn.execute('''
+                    INSERT INTO recommendations (user_id, recommendation_json)
+                    VALUES (?, ?)
+                ''', (
+                    current_user['id'],
+                    orjson.dumps(recommendation_data)
+                ))
+                conn.commit()
+
+        await asyncio.to_thread(_save)
+
         return {"success": True, "data": recommendation_data}
         
     except Exception as e:
-        print(f"Error in generate_financial_recommendation: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in generate_financial_recommendation")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
 @app.get("/api/recommendations", response_model=Dict[str, Any])
-async def get_financial_recommendation(
+def get_financial_recommendation(
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
     """Get existing financial recommendations for the current user"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Get the most recent recommendation for the user
-        cursor.execute('''
-            SELECT id, user_id, recommendation_json, created_at 
-            FROM recommendations 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        ''', (current_user['id'],))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
+        # Get the most recent recommendation for the user; the
+        # (user_id, created_at DESC) index turns this into a single
+        # index seek instead of a scan-and-sort
+        with get_db_connection() as conn:
+            row = conn.execute('''
+                SELECT recommendation_json, created_at
+                FROM recommendations
+                WHERE user_id = ?
+                ORDER BY created_at DESC
+                LIMIT 1
+            ''', (current_user['id'],)).fetchone()
+
         if row:
             try:
                 # Parse the JSON data
-                recommendation_data = json.loads(row['recommendation_json'])
+                recommendation_data = orjson.loads(row['recommendation_json'])
                 return {
-                    "success": True, 
+                    "success": True,
                     "data": recommendation_data,
                     "created_at": row['created_at']
                 }
-            except json.JSONDecodeError as e:
-                print(f"Error parsing recommendation JSON: {e}")
+            except orjson.JSONDecodeError as e:
+                log.error("Error parsing recommendation JSON: %s", e)
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Failed to parse recommendation data"
@@ -377,9 +528,7 @@ async def get_financial_recommendation(
             }
             
     except Exception as e:
-        print(f"Error in get_financial_recommendation: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in get_financial_recommendation")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -389,36 +538,33 @@ async def get_financial_recommendation(
 async def signup(user: UserCreate):
     """Handle user signup"""
     try:
-        print(f"Starting signup for email: {user.email}")
+        log.debug("Starting signup for email: %s", user.email)
         
-        # Check if user already exists
-        print("Checking if user exists...")
-        existing_user = get_user_by_email(user.email)
+        # Check if user already exists (worker thread: SQLite is blocking)
+        existing_user = await asyncio.to_thread(get_user_by_email, user.email)
         if existing_user:
-            print(f"User with email {user.email} already exists")
+            log.debug("User with email %s already exists", user.email)
             raise HTTPException(
                 status_code=400,
                 detail="Email already registered"
             )
         
         # Create new user
-        print("Creating new user...")
         try:
-            user_id = create_user(user)
-            print(f"User created successfully with ID: {user_id}")
+            hashed_password = await ahash_password(user.password)
+            user_id = await asyncio.to_thread(create_user, user, hashed_password)
+            log.debug("User created successfully with ID: %s", user_id)
         except Exception as e:
-            print(f"Error in create_user: {str(e)}")
+            log.error("Error in create_user: %s", e)
             raise
         
         # Generate token
-        print("Generating access token...")
         try:
             access_token = create_access_token(
                 data={"sub": user.email}  # Using email as subject for JWT
             )
-            print("Access token generated successfully")
         except Exception as e:
-            print(f"Error generating access token: {str(e)}")
+            log.error("Error generating access token: %s", e)
             raise
         
         return {
@@ -428,65 +574,68 @@ async def signup(user: UserCreate):
         }
         
     except HTTPException as he:
-        print(f"HTTPException in signup: {str(he.detail)}")
+        log.debug("HTTPException in signup: %s", he.detail)
         raise
     except Exception as e:
-        print(f"Unexpected error in signup: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Unexpected error in signup")
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error during signup: {str(e)}"
         )
 
+def get_user_with_profile(email: str) -> Optional[Dict[str, Any]]:
+    """Fetch a user and their profile (if any) in one LEFT JOIN query."""
+    with get_db_connection() as conn:
+        row = conn.execute(_SQL_USER_WITH_PROFILE, (email,)).fetchone()
+
+    if row is None:
+        return None
+
+    has_profile = row['date_of_birth'] is not None
+    user_data = {
+        "id": row['id'],
+        "name": row['name'],
+        "email": row['email'],
+        "has_profile": has_profile
+    }
+
+    if has_profile:
+        user_data["profile"] = {
+            "date_of_birth": row['date_of_birth'],
+            "monthly_income": row['monthly_income'],
+            "monthly_expenses": row['monthly_expenses'],
+            "risk_appetite": row['risk_appetite'],
+            "investment_horizon_years": row['investment_horizon_years'],
+            "financial_goals": orjson.loads(row['financial_goals']) if row['financial_goals'] else []
+        }
+
+    return user_data
+
+# Endpoints below are plain def: they do blocking SQLite work, so Starlette
+# runs them in its threadpool instead of stalling the event loop
 @app.get("/users/me", response_model=Dict[str, Any])
-async def read_users_me(current_user: Dict[str, Any] = Depends(get_current_user)):
+def read_users_me(current_user: Dict[str, Any] = Depends(get_current_user)):
     """Get current user information."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT * FROM user_profiles WHERE user_id = ?",
-            (current_user['id'],)
-        )
-        profile = cursor.fetchone()
-        
-        user_data = {
-            "id": current_user['id'],
-            "name": current_user['name'],
-            "email": current_user['email'],
-            "has_profile": profile is not None
-        }
-        
-        if profile:
-            user_data["profile"] = {
-                "date_of_birth": profile[1],
-                "monthly_income": profile[2],
-                "monthly_expenses": profile[3],
-                "risk_appetite": profile[4],
-                "investment_horizon_years": profile[5],
-                "financial_goals": json.loads(profile[6]) if profile[6] else []
-            }
-            
-        return user_data
-    finally:
-        conn.close()
+    user_data = get_user_with_profile(current_user['email'])
+    if user_data is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_data
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     """OAuth2 compatible token login, get an access token for future requests."""
-    print(f"Login attempt for email: {form_data.username}")  # Debug log
-    user = get_user(form_data.username)
+    log.debug("Login attempt for email: %s", form_data.username)
+    user = await asyncio.to_thread(get_user, form_data.username)
     if not user:
-        print("User not found")  # Debug log
+        log.debug("Login failed: user not found")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if not verify_password(form_data.password, user["password_hash"]):
-        print("Invalid password")  # Debug log
+    if not await averify_password(form_data.password, user["password_hash"]):
+        log.debug("Login failed: invalid password")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -500,145 +649,90 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/check-email")
-async def check_email_exists(email: str):
-    conn = get_db_connection()
+def check_email_exists(email: str):
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE email = ?", (email,))
-        user = cursor.fetchone()
+        with get_db_connection() as conn:
+            user = conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
         return {"exists": user is not None}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 @app.post("/users/me/profile")
-async def create_update_profile(
+def create_update_profile(
     profile: UserProfileCreate,
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
     """Create or update user profile."""
-    print(f"Received profile update request for user_id: {current_user['id']}")
-    print(f"Profile data: {profile.dict()}")
+    if log.isEnabledFor(logging.DEBUG):
+        # profile.dict() allocates; only pay for it when DEBUG is on
+        log.debug("Profile update for user_id %s: %s", current_user['id'], profile.dict())
     
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Validate the user exists
-        cursor.execute("SELECT id FROM users WHERE id = ?", (current_user['id'],))
-        if not cursor.fetchone():
-            print(f"User not found: {current_user['id']}")
-            raise HTTPException(
-                status_code=404,
-                detail="User not found. Please log in again."
-            )
-        
         # Convert financial_goals list to a JSON string
         try:
-            financial_goals_json = json.dumps(profile.financial_goals)
-            print(f"Formatted financial goals: {financial_goals_json}")
+            financial_goals_json = orjson.dumps(profile.financial_goals).decode()
         except Exception as e:
             error_msg = f"Invalid financial goals format: {str(e)}"
-            print(error_msg)
+            log.warning("%s", error_msg)
             raise HTTPException(
                 status_code=400,
                 detail=error_msg
             )
-        
-        # Check if profile already exists
-        cursor.execute(
-            "SELECT 1 FROM user_profiles WHERE user_id = ?",
-            (current_user['id'],)
-        )
-        profile_exists = cursor.fetchone() is not None
-        print(f"Profile exists: {profile_exists}")
-        
-        try:
-            if profile_exists:
-                print("Updating existing profile...")
-                # Update existing profile
-                cursor.execute("""
-                    UPDATE user_profiles 
-                    SET date_of_birth = ?, 
-                        monthly_income = ?, 
-                        monthly_expenses = ?, 
-                        risk_appetite = ?,
-                        investment_horizon_years = ?, 
-                        financial_goals = ?,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                """, (
-                    profile.date_of_birth,
-                    float(profile.monthly_income),
-                    float(profile.monthly_expenses),
-                    profile.risk_appetite,  # Already validated by Pydantic
-                    int(profile.investment_horizon_years),
-                    financial_goals_json,
-                    current_user['id']
-                ))
-                print("Profile update query executed")
-            else:
-                print("Creating new profile...")
-                # Create new profile
-                cursor.execute("""
-                    INSERT INTO user_profiles 
-                    (user_id, date_of_birth, monthly_income, monthly_expenses,risk_appetite, investment_horizon_years, financial_goals)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
+
+        with get_db_connection() as conn:
+            # Validate the user exists
+            if not conn.execute(_SQL_USER_EXISTS, (current_user['id'],)).fetchone():
+                log.warning("User not found: %s", current_user['id'])
+                raise HTTPException(
+                    status_code=404,
+                    detail="User not found. Please log in again."
+                )
+
+            try:
+                # Create or update in one statement
+                # Fields are already coerced by the pydantic model; no
+                # re-casting needed
+                conn.execute(_SQL_UPSERT_PROFILE, (
                     current_user['id'],
                     profile.date_of_birth,
-                    float(profile.monthly_income),
-                    float(profile.monthly_expenses),
-                    profile.risk_appetite,  # Already validated by Pydantic
-                    int(profile.investment_horizon_years),
+                    profile.monthly_income,
+                    profile.monthly_expenses,
+                    profile.risk_appetite,
+                    profile.investment_horizon_years,
                     financial_goals_json
                 ))
-                print("Profile insert query executed")
-            
-            conn.commit()
-            print("Transaction committed successfully")
-            return {"message": "Profile updated successfully", "profile_updated": True}
-            
-        except sqlite3.Error as e:
-            if conn:
+                conn.commit()
+                # The agent caches profiles and recommendations per user;
+                # drop them so the next run sees the new profile
+                invalidate_user_caches(current_user['id'])
+                return {"message": "Profile updated successfully", "profile_updated": True}
+
+            except sqlite3.Error as e:
                 conn.rollback()
-            error_detail = f"Database error: {str(e)}"
-            if "UNIQUE constraint failed" in str(e):
-                error_detail = "A profile already exists for this user"
-            elif "FOREIGN KEY constraint failed" in str(e):
-                error_detail = "Invalid user reference. Please log in again."
-            
-            print(f"Database error: {error_detail}")
-            print(f"SQLite error: {str(e)}")
-            raise HTTPException(
-                status_code=400,
-                detail=error_detail
-            )
-            
+                error_detail = f"Database error: {str(e)}"
+                if "UNIQUE constraint failed" in str(e):
+                    error_detail = "A profile already exists for this user"
+                elif "FOREIGN KEY constraint failed" in str(e):
+                    error_detail = "Invalid user reference. Please log in again."
+
+                log.error("Database error: %s (%s)", error_detail, e)
+                raise HTTPException(
+                    status_code=400,
+                    detail=error_detail
+                )
+
     except HTTPException as he:
-        print(f"HTTPException occurred: {he.detail}")
+        log.debug("HTTPException in create_update_profile: %s", he.detail)
         raise
     except Exception as e:
-        print(f"Unexpected error in create_update_profile: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Unexpected error in create_update_profile")
         raise HTTPException(
             status_code=500,
             detail=f"An unexpected error occurred while processing your request: {str(e)}"
         )
-    finally:
-        if conn:
-            try:
-                conn.close()
-                print("Database connection closed")
-            except Exception as e:
-                print(f"Error closing database connection: {str(e)}")
-            conn.close()
 
 @app.get("/users/me/recommendations")
-async def get_recommendations(
+def get_recommendations(
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
     """Get the most recent recommendations for the current user from the database.
@@ -689,4 +783,16 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Auto-reload only in development; in production run multiple workers
+    # (WEB_CONCURRENCY, per process manager convention). loop/http "auto"
+    # picks uvloop and httptools when they are installed.
+    dev_mode = os.getenv("DEV", "").lower() in ("1", "true", "yes")
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=dev_mode,
+        workers=1 if dev_mode else int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="auto",
+        http="auto",
+    )
\ No newline at end of file
@@ -1,41 +1,65 @@
 import json
-import random
+
+import numpy as np
 
 # Constants
 sectors = ["Banking", "NBFC", "Technology", "Healthcare", "Energy", "FMCG", "Telecom", "Pharma"]
 categories = ["Equity", "Debt", "Hybrid", "Index", "Thematic"]
 banks = ["SafeBank", "TrustBank", "GrowBank", "NeoBank", "SecureBank"]
+tenures = [6, 12, 24, 36, 48, 60]
+
+N_STOCKS = 10
+N_FUNDS = 10
+N_FDS = 11
+
+# One generator, one draw per field: the vectorized uniform/integers calls
+# replace a Python-level random call per record
+rng = np.random.default_rng()
+
+def draw_rates(rng, lo, hi, n):
+    """Draw n uniform rates in [lo, hi) rounded to 2 decimals, in one pass."""
+    return np.round(rng.uniform(lo, hi, n), 2)
+
+stock_sectors = rng.integers(0, len(sectors), N_STOCKS)
+stock_growth = draw_rates(rng, 5.0, 25.0, N_STOCKS)
+
+fund_categories = rng.integers(0, len(categories), N_FUNDS)
+fund_returns = draw_rates(rng, 6.0, 18.0, N_FUNDS)
+
+fd_banks = rng.integers(0, len(banks), N_FDS)
+fd_tenures = rng.choice(tenures, N_FDS)
+fd_rates = draw_rates(rng, 5.0, 8.5, N_FDS)
 
-# Generate 25 mock stocks
+# Generate mock stocks
 stocks = [
     {
         "symbol": f"SYM{i:03}",
         "name": f"Company{i:03} Ltd",
-        "sector": random.choice(sectors),
-        "growth_pct_yoy": round(random.uniform(5.0, 25.0), 2)
+        "sector": sectors[stock_sectors[i - 1]],
+        "growth_pct_yoy": float(stock_growth[i - 1])
     }
-    for i in range(1, 11)
+    for i in range(1, N_STOCKS + 1)
 ]
 
-# Generate 25 mock mutual funds
+# Generate mock mutual funds
 mutual_funds = [
     {
-        "code": f"MF_{cat[:2].upper()}_{i:03}",
-        "name": f"{cat} Fund {i}",
-        "category": cat,
-        "return_pct_3y_cagr": round(random.uniform(6.0, 18.0), 2)
+        "code": f"MF_{categories[fund_categories[i - 1]][:2].upper()}_{i:03}",
+        "name": f"{categories[fund_categories[i - 1]]} Fund {i}",
+        "category": categories[fund_categories[i - 1]],
+        "return_pct_3y_cagr": float(fund_returns[i - 1])
     }
-    for i, cat in zip(range(1, 11), [random.choice(categories) for _ in range(11)])
+    for i in range(1, N_FUNDS + 1)
 ]
 
-# Generate 25 mock fixed deposit options
+# Generate mock fixed deposit options
 fixed_deposits = [
     {
-        "bank": random.choice(banks),
-        "tenure_months": random.choice([6, 12, 24, 36, 48, 60]),
-        "rate_pct": round(random.uniform(5.0, 8.5), 2)
+        "bank": banks[fd_banks[i]],
+        "tenure_months": int(fd_tenures[i]),
+        "rate_pct": float(fd_rates[i])
     }
-    for _ in range(11)
+    for i in range(N_FDS)
 ]
 
 # Construct final market data structure
@@ -51,4 +75,4 @@ market_data = {
 with open("market_data.json", "w") as f:
     json.dump(market_data, f, indent=2)
 
-print("✅ market_data.json with 11 entries per category has been created.")
+print("✅ market_data.json with mock entries per category has been created.")
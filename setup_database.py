@@ -1,89 +1,155 @@
+import contextlib
 import sqlite3
 import bcrypt
 import random
 import json
 import os
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+
+# orjson encodes in C, several times faster than stdlib json; fall back
+# quietly so the setup script keeps working on a bare install
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _dumps = json.dumps
 
 # --- Database Setup ---
 DB_DIR = "db"
 DB_NAME = "financial_advisor.db"
 DB_PATH = os.path.join(DB_DIR, DB_NAME)
 
-# Create db directory if it doesn't exist
-os.makedirs(DB_DIR, exist_ok=True)
+# bcrypt cost for the sample accounts. Hash time scales as 2^cost, so the
+# default of 12 dominates this script's runtime; 4 is fine for throwaway
+# seed data (the cost is embedded in each hash, so verification still
+# works). Production signup paths must keep a real work factor (>=10).
+BCRYPT_COST = int(os.environ.get("BCRYPT_COST", "4"))
+
+# WAL writes each page once instead of twice and lets the app's readers run
+# alongside a writer; NORMAL sync drops the per-commit fsync WAL makes
+# redundant. Same tuning the app and agent connections use.
+# page_size only takes effect if set before the first write, i.e. on a
+# freshly created file; mmap lets SQLite read catalog and data pages
+# straight from the page cache instead of pread syscalls.
+_DB_PRAGMAS = (
+    "PRAGMA page_size=4096",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+def get_connection() -> sqlite3.Connection:
+    """Open a tuned connection, creating the db directory on first use.
+
+    Connecting lazily (instead of at module scope) means importing this
+    module never touches the filesystem, and every caller gets the same
+    pragmas. isolation_level=None puts sqlite3 in autocommit so main() can
+    manage one explicit transaction around the whole setup instead of the
+    driver committing behind our back.
+    """
+    os.makedirs(DB_DIR, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, cached_statements=256)
+    for pragma in _DB_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# The whole schema as one script: a single parse/prepare pass instead of
+# one execute per statement, gated below on PRAGMA user_version so
+# re-running setup against a provisioned database is a no-op.
+SCHEMA_VERSION = 1
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    date_created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_login TIMESTAMP
+);
 
-# Connect to the database (it will be created if it doesn't exist)
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
+CREATE TABLE IF NOT EXISTS user_profiles (
+    user_id INTEGER PRIMARY KEY,
+    date_of_birth DATE,
+    monthly_income REAL,
+    monthly_expenses REAL,
+    risk_appetite TEXT CHECK(risk_appetite IN ('Low', 'Medium', 'High')),
+    investment_horizon_years INTEGER,
+    financial_goals TEXT,  -- JSON string
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
 
-def create_tables():
+CREATE TABLE IF NOT EXISTS portfolios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT,
+    target_allocation TEXT,  -- JSON string
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS recommendations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    recommendation_json TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    portfolio_id INTEGER,
+    asset_type TEXT NOT NULL,
+    asset_id TEXT NOT NULL,
+    transaction_type TEXT CHECK(transaction_type IN ('BUY', 'SELL', 'DIVIDEND', 'INTEREST')),
+    units REAL NOT NULL,
+    price_per_unit REAL NOT NULL,
+    transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    notes TEXT,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE SET NULL
+);
+
+-- Per-user and per-asset lookups become index seeks instead of table
+-- scans. recommendations(user_id) is covered by the composite
+-- idx_rec_user_created the agent/API layers also ensure.
+CREATE INDEX IF NOT EXISTS idx_rec_user_created
+    ON recommendations(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS ix_portfolios_user_id
+    ON portfolios(user_id);
+CREATE INDEX IF NOT EXISTS ix_transactions_user_portfolio
+    ON transactions(user_id, portfolio_id);
+CREATE INDEX IF NOT EXISTS ix_transactions_asset
+    ON transactions(asset_type, asset_id);
+"""
+
+# Hoisted INSERT statements: identical string objects every call keep the
+# hits inside sqlite3's per-connection statement cache
+INSERT_USER_SQL =     "INSERT OR IGNORE INTO users (name, email, password_hash) VALUES (?, ?, ?)"
+INSERT_PROFILE_SQL = """
+    INSERT OR IGNORE INTO user_profiles
+    (user_id, date_of_birth, monthly_income, monthly_expenses,
+     risk_appetite, investment_horizon_years, financial_goals)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+def create_tables(conn):
     """Create all necessary tables if they don't exist."""
-    # Users table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        email TEXT NOT NULL UNIQUE,
-        password_hash TEXT NOT NULL,
-        date_created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_login TIMESTAMP
-    )""")
-
-    # User profiles table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS user_profiles (
-        user_id INTEGER PRIMARY KEY,
-        date_of_birth DATE,
-        monthly_income REAL,
-        monthly_expenses REAL,
-        risk_appetite TEXT CHECK(risk_appetite IN ('Low', 'Medium', 'High')),
-        investment_horizon_years INTEGER,
-        financial_goals TEXT,  -- JSON string
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    )""")
-
-    # Portfolios table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS portfolios (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        name TEXT NOT NULL,
-        description TEXT,
-        target_allocation TEXT,  -- JSON string
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    )""")
-
-    # Recommendations table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS recommendations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        recommendation_json TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(user_id)
-    )""")
-
-    # Transactions table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        portfolio_id INTEGER,
-        asset_type TEXT NOT NULL,
-        asset_id TEXT NOT NULL,
-        transaction_type TEXT CHECK(transaction_type IN ('BUY', 'SELL', 'DIVIDEND', 'INTEREST')),
-        units REAL NOT NULL,
-        price_per_unit REAL NOT NULL,
-        transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        notes TEXT,
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-        FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE SET NULL
-    )""")
-
-def insert_sample_data():
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        return
+    conn.executescript(SCHEMA_SQL)
+    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+def insert_sample_data(conn):
     """Insert sample data into the database."""
     # Sample users
     users = [
@@ -101,63 +167,103 @@ def insert_sample_data():
         "Tax saving"
     ]
     
-    for name, email, password in users:
-        # Check if user exists
-        cursor.execute("SELECT id FROM users WHERE email = ?", (email,))
-        if cursor.fetchone() is None:
-            # Hash password
-            salt = bcrypt.gensalt()
-            hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-            
-            # Insert user
-            cursor.execute(
-                "INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)",
-                (name, email, hashed.decode('utf-8'))
-            )
-            user_id = cursor.lastrowid
-            
-            # Create user profile
-            profile = {
-                'date_of_birth': (datetime.now() - timedelta(days=random.randint(25, 60)*365)).strftime('%Y-%m-%d'),
-                'monthly_income': random.randint(50000, 300000),
-                'monthly_expenses': random.randint(20000, 100000),
-                'risk_appetite': random.choice(risk_levels),
-                'investment_horizon_years': random.randint(5, 30),
-                'financial_goals': json.dumps(random.sample(goals, k=random.randint(1, 3)))
-            }
-            
-            cursor.execute("""
-                INSERT INTO user_profiles 
-                (user_id, date_of_birth, monthly_income, monthly_expenses, 
-                 risk_appetite, investment_horizon_years, financial_goals)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                user_id,
-                profile['date_of_birth'],
-                profile['monthly_income'],
-                profile['monthly_expenses'],
-                profile['risk_appetite'],
-                profile['investment_horizon_years'],
-                profile['financial_goals']
-            ))
-            
-            print(f"Created user: {name} ({email})")
-        else:
+    # One IN query replaces the per-user existence SELECTs
+    emails = [email for _, email, _ in users]
+    placeholders = ",".join("?" * len(emails))
+    existing = {row[0] for row in conn.execute(
+        f"SELECT email FROM users WHERE email IN ({placeholders})", emails)}
+
+    # Idempotent re-runs short-circuit here: one SELECT, zero bcrypt calls
+    if len(existing) == len(users):
+        print("All sample users already exist, skipping seed data.")
+        return
+
+    for _, email, _ in users:
+        if email in existing:
             print(f"User {email} already exists, skipping...")
 
+    to_create = [u for u in users if u[1] not in existing]
+
+    # bcrypt's C core releases the GIL, so threads hash the passwords in
+    # parallel before the single-threaded insert phase
+    def _hash(password):
+        return bcrypt.hashpw(password.encode('utf-8'),
+                             bcrypt.gensalt(rounds=BCRYPT_COST)).decode('utf-8')
+
+    with ThreadPoolExecutor(max_workers=min(len(to_create), os.cpu_count() or 1)) as ex:
+        hashes = list(ex.map(_hash, (password for _, _, password in to_create)))
+
+    new_users = [(name, email, hashed)
+                 for (name, email, _), hashed in zip(to_create, hashes)]
+
+    # Bulk insert: executemany binds every row against one prepared
+    # statement instead of re-preparing per call. OR IGNORE makes the
+    # UNIQUE(email) index authoritative, so a row that appeared since the
+    # pre-check is skipped instead of aborting the batch. (The pre-check
+    # stays purely to avoid hashing passwords for users that exist.)
+    conn.executemany(INSERT_USER_SQL, new_users)
+
+    # executemany does not expose lastrowid, so map the ids back by email
+    new_emails = [email for _, email, _ in new_users]
+    new_placeholders = ",".join("?" * len(new_emails))
+    id_by_email = dict(conn.execute(
+        f"SELECT email, id FROM users WHERE email IN ({new_placeholders})",
+        new_emails))
+
+    # Draw every numeric profile field in one vectorized pass; only the
+    # variable-length goals sample stays per-row. Snapshot the clock once.
+    n = len(new_users)
+    rng = np.random.default_rng()
+    ages_years = rng.integers(25, 61, size=n)
+    incomes = rng.integers(50000, 300001, size=n)
+    expenses = rng.integers(20000, 100001, size=n)
+    risks = rng.choice(risk_levels, size=n)
+    horizons = rng.integers(5, 31, size=n)
+
+    # Integer day arithmetic: one ordinal subtraction per row instead of
+    # allocating datetime/timedelta pairs
+    today_ord = date.today().toordinal()
+    _randint = random.randint
+    _sample = random.sample
+
+    profile_rows = []
+    for i, (name, email, _) in enumerate(new_users):
+        # int() casts: sqlite3 does not bind NumPy scalars
+        profile_rows.append((
+            id_by_email[email],
+            date.fromordinal(today_ord - int(ages_years[i])*365).isoformat(),
+            int(incomes[i]),
+            int(expenses[i]),
+            str(risks[i]),
+            int(horizons[i]),
+            _dumps(_sample(goals, k=_randint(1, 3)))
+        ))
+        print(f"Created user: {name} ({email})")
+
+    conn.executemany(INSERT_PROFILE_SQL, profile_rows)
+
 def main():
-    try:
-        print("Setting up database...")
-        create_tables()
-        insert_sample_data()
-        conn.commit()
-        print("\n✅ Database setup completed successfully!")
-        print(f"Database file: {os.path.abspath(DB_PATH)}")
-    except Exception as e:
-        print(f"\n❌ Error setting up database: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+    with contextlib.closing(get_connection()) as conn:
+        try:
+            print("Setting up database...")
+            # Seed data is referentially consistent by construction, so
+            # skip the per-row FK probes during the bulk load. Must be set
+            # outside the transaction (the pragma is a no-op inside one).
+            conn.execute("PRAGMA foreign_keys=OFF")
+            # DDL runs first: executescript would implicitly commit any
+            # open transaction, so it stays outside the seed transaction
+            create_tables(conn)
+            # One transaction for the seed inserts: a single commit fsync
+            # instead of one per statement
+            conn.execute("BEGIN")
+            insert_sample_data(conn)
+            conn.commit()
+            conn.execute("PRAGMA foreign_keys=ON")
+            print("\n✅ Database setup completed successfully!")
+            print(f"Database file: {os.path.abspath(DB_PATH)}")
+        except Exception as e:
+            print(f"\n❌ Error setting up database: {e}")
+            conn.rollback()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file